@@ -94,36 +94,26 @@
 
 
 import io
-import torch
+from typing import List, Optional
 import numpy as np
 from PIL import Image
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-import timm
-import torchvision.transforms as T
 import requests
 from math import radians, sin, cos, asin, sqrt
 import time
 from functools import lru_cache
 
+import job_queue
+from autotune import apply_runtime_config, load_runtime_config
+from pipeline import DamagePipeline
+
 
 service_cache = {}  # key -> {"timestamp": ..., "data": ...}
 CACHE_TTL = 300      # 5 minutes (change if needed)
 
-# ---------------------------------------
-# CONFIG
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-severity_model_path = "convnextb_finetuned.pth"
-type_model_path     = "mobilenetv3_large_100_type_best.pth"
-yolo_model_path     = "runs/detect/train/weights/best.pt"
-
-
-severity_classes = ["mild", "moderate", "severe"]
-type_classes     = ["Dent","Scratch","Crack","glass shatter","lamp broken","tire flat"]
-# ---------------------------------------
-
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -137,25 +127,18 @@ app.add_middleware(
 # ---------------------------------------
 # LOAD MODELS
 # ---------------------------------------
-from ultralytics import YOLO
-yolo_model = YOLO(yolo_model_path).to(device)
-yolo_model.eval()
-
-severity_model = timm.create_model("convnext_base", pretrained=False, num_classes=len(severity_classes))
-severity_model.load_state_dict(torch.load(severity_model_path, map_location=device))
-severity_model.to(device)
-severity_model.eval()
-
-type_model = timm.create_model("mobilenetv3_large_100", pretrained=False, num_classes=len(type_classes))
-type_model.load_state_dict(torch.load(type_model_path, map_location=device))
-type_model.to(device)
-type_model.eval()
-
-tfm = T.Compose([
-    T.Resize((224,224)),
-    T.ToTensor(),
-    T.Normalize([0.485,0.456,0.406],[0.229,0.224,0.225]),
-])
+# model paths, class lists and transforms live in pipeline.py
+pipeline = None
+
+@app.on_event("startup")
+def load_models():
+    global pipeline
+    # thread counts / core pinning from `python autotune.py` (no-op if not tuned)
+    config = apply_runtime_config()
+    pipeline = DamagePipeline(
+        batch_size=config.get("classifier_batch_size"),
+        max_concurrent=config.get("max_concurrent_forwards"),
+    )
 
 # ---------------------------------------
 # HELPER: haversine distance
@@ -173,37 +156,52 @@ def haversine(lat1, lon1, lat2, lon2):
 # ---------------------------------------
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
+    job_queue.touch_interactive()   # bulk job workers back off while we serve this
     raw = await file.read()
     img = Image.open(io.BytesIO(raw)).convert("RGB")
 
-    results = yolo_model(img, verbose=False)[0]
+    output, meta = await run_in_threadpool(pipeline.predict_with_meta, img)
+
+    job_queue.touch_interactive()
+    return {"predictions": output, "meta": meta}
+
+# ---------------------------------------
+# BULK JOBS (processed by inference_worker.py)
+# ---------------------------------------
+def _store_job(uploads, callback_url):
+    conn = job_queue.connect()
+    try:
+        return job_queue.submit_job(conn, uploads, callback_url)
+    finally:
+        conn.close()
 
-    output = []
-    for box in results.boxes:
-        x1,y1,x2,y2 = map(int, box.xyxy[0])
-        cls_name = yolo_model.names[int(box.cls)]
 
-        crop = img.crop((x1,y1,x2,y2))
-        crop_t = tfm(crop).unsqueeze(0).to(device)
+@app.post("/jobs")
+async def submit_job(files: List[UploadFile] = File(...), callback_url: Optional[str] = Form(None)):
+    """
+    Queue images for asynchronous assessment. Poll /jobs/{job_id} or pass a
+    callback_url that receives the finished job as JSON.
+    """
+    uploads = [(f.filename, await f.read()) for f in files]
+    if not uploads:
+        return {"error": "No images uploaded"}
 
-        # severity prediction
-        with torch.no_grad():
-            sev_pred = severity_model(crop_t).argmax(dim=1).item()
-            severity_label = severity_classes[sev_pred]
+    # file writes + fsync and the SQLite transaction block, keep them off the event loop
+    job_id = await run_in_threadpool(_store_job, uploads, callback_url)
+    return {"job_id": job_id, "status": "queued", "total": len(uploads)}
 
-        # type prediction
-        with torch.no_grad():
-            type_pred = type_model(crop_t).argmax(dim=1).item()
-            type_label = type_classes[type_pred]
 
-        output.append({
-            "part": cls_name,
-            "severity": severity_label,
-            "damage_type": type_label,
-            "x1": x1, "y1": y1, "x2": x2, "y2": y2
-        })
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    conn = job_queue.connect()
+    try:
+        job = job_queue.get_job(conn, job_id)
+    finally:
+        conn.close()
 
-    return {"predictions": output}
+    if job is None:
+        return {"error": "Job not found"}
+    return job
 
 # ---------------------------------------
 # 2️⃣ NEW: NEAREST SERVICE CENTRES ENDPOINT
@@ -385,4 +383,5 @@ def centre_details(lat: float, lon: float):
 # MAIN
 # ---------------------------------------
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    workers = load_runtime_config().get("workers", 1)
+    uvicorn.run("app:app", host="0.0.0.0", port=5000, workers=workers)
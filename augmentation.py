@@ -1,64 +1,179 @@
-import os
-import random
+"""Class balancing and augmentation inside the DataLoader.
+
+Instead of writing *_aug{i}.jpg copies into the training folder, minority classes
+are oversampled with a class-balanced WeightedRandomSampler and every batch gets
+the same random flip / 90-degree rotation / brightness / contrast operations as
+before, applied as batched tensor ops in the DataLoader workers:
+
+    from augmentation import make_balanced_loader
+    loader = make_balanced_loader(ROOT, batch_size=64, workers=8)
+    for images, labels in loader:          # uint8 NCHW, already augmented
+        x = normalize_batch(images)
+
+Commands:
+
+    python augmentation.py stats           # class counts and sampling weights
+    python augmentation.py clean           # delete *_aug*.jpg left by the old script
+    python augmentation.py clean --dry-run
+"""
+import argparse
+import re
+from collections import Counter
 from pathlib import Path
-from PIL import Image, ImageEnhance
 
-ROOT = Path(r"D:/COCO_dataset/types_classification/train")
-
-classes = [p.name for p in ROOT.iterdir() if p.is_dir()]   # auto detect
-print("Classes detected:", classes)
-# augment operations
-def augment_image(img: Image.Image):
-    # random flip
-    if random.random() < 0.5:
-        img = img.transpose(Image.FLIP_LEFT_RIGHT)
-
-    # random rotate
-    angle = random.choice([0, 90, 180, 270])
-    img = img.rotate(angle, expand=True)
-
-    # brightness
-    img = ImageEnhance.Brightness(img).enhance(random.uniform(0.8, 1.3))
-
-    # contrast
-    img = ImageEnhance.Contrast(img).enhance(random.uniform(0.8, 1.4))
+import cv2
+import torch
+from torch.utils.data import DataLoader, Dataset, WeightedRandomSampler
 
-    return img
+from pack_shards import class_order, collate_uint8, normalize_batch  # noqa: F401  (re-exported for training code)
 
+ROOT = Path(r"D:/COCO_dataset/types_classification/train")
 
-# count images per class
-counts = {}
-for cls in classes:
-    folder = ROOT / cls
-    counts[cls] = len(list(folder.glob("*.jpg")))
-
-print("before balancing counts:", counts)
-
-# target = max class size
-target = max(counts.values())
-
-for cls in classes:
-    folder = ROOT / cls
-    imgs = sorted(list(folder.glob("*.jpg")))
-    need = target - len(imgs)
-
-    if need <= 0:
-        print(f"{cls} already at target")
-        continue
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+IMAGE_SIZE = 224
 
-    print(f"{cls}: needs {need} augmentations")
+# files written by the old disk-based balancing: <stem>_aug<i>.jpg (possibly nested)
+AUG_PATTERN = re.compile(r"_aug\d+")
+
+# augment operations (same ranges as the old PIL version)
+FLIP_PROB = 0.5
+BRIGHTNESS = (0.8, 1.3)
+CONTRAST = (0.8, 1.4)
+
+
+def is_augmented(path):
+    return AUG_PATTERN.search(Path(path).stem) is not None
 
-    # randomly sample with replacement (safe)
-    for i in range(need):
-        src = random.choice(imgs)
-        try:
-            img = Image.open(src).convert("RGB")
-        except:
-            print("skip bad:", src)
-            continue
 
-        aug = augment_image(img)
-        new_name = folder / f"{src.stem}_aug{i}.jpg"
-        aug.save(new_name)
+class CropFolderDataset(Dataset):
+    """<root>/<class>/*.jpg as uint8 HWC RGB arrays resized to size x size.
+
+    Skips *_aug files so leftovers from the old script never count as originals.
+    `classes` fixes the label order (default: class_order() of the folder).
+    """
+
+    def __init__(self, root, size=IMAGE_SIZE, classes=None):
+        self.root = Path(root)
+        self.size = size
+        self.classes = list(classes) if classes else class_order(self.root)
+        self.samples = []
+        for label, cls in enumerate(self.classes):
+            for p in sorted((self.root / cls).iterdir()):
+                if p.suffix.lower() in IMAGE_EXTS and not is_augmented(p):
+                    self.samples.append((p, label))
+        self.targets = [label for _, label in self.samples]
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, i):
+        path, label = self.samples[i]
+        img = cv2.imread(str(path))
+        if img is None:
+            raise RuntimeError(f"Could not read {path}")
+        img = cv2.resize(img, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), label
+
 
-print("✅ balancing complete")
+def balanced_sampler(labels, num_samples=None, generator=None):
+    """Sampler that draws every class equally often (with replacement)."""
+    counts = Counter(labels)
+    weights = torch.tensor([1.0 / counts[label] for label in labels], dtype=torch.double)
+    return WeightedRandomSampler(weights, num_samples or len(labels), replacement=True, generator=generator)
+
+
+def augment_batch(images, generator=None):
+    """Random flip, 90-degree rotation, brightness and contrast on a uint8 NCHW batch.
+
+    Images must be square (rotation keeps the shape). Returns uint8 NCHW.
+    """
+    n = images.shape[0]
+    x = images.float()
+
+    # random horizontal flip
+    flip = torch.rand(n, generator=generator) < FLIP_PROB
+    if flip.any():
+        x[flip] = x[flip].flip(-1)
+
+    # random rotation by 0/90/180/270 degrees, one rot90 call per angle
+    k = torch.randint(0, 4, (n,), generator=generator)
+    for angle in (1, 2, 3):
+        sel = k == angle
+        if sel.any():
+            x[sel] = torch.rot90(x[sel], angle, dims=(-2, -1))
+
+    # brightness: scale towards black
+    b = torch.empty(n, 1, 1, 1).uniform_(*BRIGHTNESS, generator=generator)
+    x = x * b
+
+    # contrast: blend with the mean grey level of each image (like PIL ImageEnhance.Contrast)
+    c = torch.empty(n, 1, 1, 1).uniform_(*CONTRAST, generator=generator)
+    grey = (0.299 * x[:, 0] + 0.587 * x[:, 1] + 0.114 * x[:, 2]).mean(dim=(-2, -1)).view(n, 1, 1, 1)
+    x = (x - grey) * c + grey
+
+    return x.clamp_(0, 255).round_().to(torch.uint8)
+
+
+def augmenting_collate(batch):
+    """collate_fn that stacks and augments, so the work happens in the loader workers."""
+    images, labels = collate_uint8(batch)
+    return augment_batch(images), labels
+
+
+def make_balanced_loader(root=ROOT, batch_size=64, workers=4, size=IMAGE_SIZE, augment=True):
+    dataset = CropFolderDataset(root, size)
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        sampler=balanced_sampler(dataset.targets),
+        num_workers=workers,
+        collate_fn=augmenting_collate if augment else collate_uint8,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=workers > 0,
+    )
+
+
+def print_stats(root):
+    dataset = CropFolderDataset(root)
+    counts = Counter(dataset.targets)
+    total = len(dataset.targets)
+    print("Classes detected:", dataset.classes)
+    for label, cls in enumerate(dataset.classes):
+        n = counts[label]
+        share = 1.0 / len(dataset.classes)
+        print(f"  {cls:<15} {n:>7} originals, sampled {share:.1%} of the time "
+              f"(~{total * share / max(n, 1):.1f}x each per epoch)")
+
+
+def clean(root, dry_run=False):
+    removed, freed = 0, 0
+    for p in Path(root).rglob("*"):
+        if p.suffix.lower() in IMAGE_EXTS and is_augmented(p):
+            freed += p.stat().st_size
+            removed += 1
+            if not dry_run:
+                p.unlink()
+    verb = "Would delete" if dry_run else "🗑️ Deleted"
+    print(f"{verb} {removed} augmented files ({freed / 1e6:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-loader class balancing and augmentation")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("stats", help="class counts and balanced sampling rates")
+    p.add_argument("--root", default=str(ROOT))
+
+    p = sub.add_parser("clean", help="delete *_aug*.jpg files written by the old balancing script")
+    p.add_argument("--root", default=str(ROOT))
+    p.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "stats":
+        print_stats(args.root)
+    else:
+        clean(args.root, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""CPU threading auto-tuner for the inference workers.
+
+    python autotune.py                      # synthetic images, writes runtime_config.json
+    python autotune.py --images some/dir    # benchmark on real photos instead
+
+Benchmarks YOLO + both classifiers on this host for every combination of
+uvicorn worker count and intra-op threads per worker (workers x threads never
+exceeds the core count), then sweeps the classifier batch size for the winner.
+The best configuration is written to runtime_config.json, which app.py applies
+at startup through apply_runtime_config().
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+# ---------------------------------------
+# CONFIG
+RUNTIME_CONFIG_PATH = Path("runtime_config.json")
+SLOT_DIR = Path(".worker_slots")   # lock files used to hand out core ranges to workers
+
+BENCH_SECONDS = 20            # measured time per configuration
+WARMUP_IMAGES = 3
+BOXES_PER_IMAGE = 3           # crops classified per synthetic image
+BATCH_SIZES = [1, 4, 8, 16, 32]
+STARTUP_TIMEOUT = 300         # seconds for a benchmark process to load models and warm up
+# ---------------------------------------
+
+_slot_handle = None   # keeps the slot lock alive for the lifetime of the process
+
+
+def load_runtime_config(path=RUNTIME_CONFIG_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def usable_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def claim_worker_slot(n_slots, slot_dir=SLOT_DIR):
+    """Give each server worker process a distinct index in [0, n_slots).
+
+    Uses an exclusive lock per slot file, so a restarted worker simply takes over
+    the slot of the one that died. Returns None when no slot is free or locking
+    is not supported on this platform.
+    """
+    global _slot_handle
+
+    env_slot = os.environ.get("AUTOXPERT_WORKER_SLOT")
+    if env_slot is not None:
+        return int(env_slot)
+
+    try:
+        import fcntl
+    except ImportError:
+        return None   # Windows: no pinning
+
+    slot_dir = Path(slot_dir)
+    slot_dir.mkdir(parents=True, exist_ok=True)
+    for slot in range(n_slots):
+        handle = open(slot_dir / f"slot{slot}.lock", "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_handle = handle
+        return slot
+    return None
+
+
+def apply_runtime_config(config=None, pin=True):
+    """Apply thread counts (and optionally core pinning) from runtime_config.json.
+
+    Must run before the models are loaded. Returns the config that was applied,
+    or an empty dict if the host has not been tuned yet.
+    """
+    import torch
+
+    if config is None:
+        config = load_runtime_config()
+    if not config:
+        return {}
+
+    threads = config.get("intra_op_threads")
+    if pin and config.get("pin_cores") and hasattr(os, "sched_setaffinity"):
+        slot = claim_worker_slot(config.get("workers", 1))
+        if slot is not None and threads:
+            cores = usable_cores()
+            mine = cores[slot * threads:(slot + 1) * threads]
+            if mine:
+                os.sched_setaffinity(0, mine)
+                print(f"📌 worker slot {slot} pinned to cores {mine}")
+
+    if threads:
+        torch.set_num_threads(threads)
+    if config.get("inter_op_threads"):
+        try:
+            torch.set_num_interop_threads(config["inter_op_threads"])
+        except RuntimeError:
+            pass   # already set (inter-op pool was started before us)
+    return config
+
+
+def apply_bulk_worker_config(n_bulk, threads=None):
+    """Thread budget for inference_worker.py processes running next to the API.
+
+    The tuned API layout already uses workers x intra_op_threads cores (all of them
+    if untuned), so bulk workers split what is left, with at least 1 thread each,
+    instead of stacking full-size thread pools on top. With pin_cores they are
+    pinned to the leftover cores. Returns the applied config.
+    """
+    import torch
+
+    config = load_runtime_config()
+    cores = usable_cores()
+    used = config.get("workers", 1) * config.get("intra_op_threads", 0) if config else len(cores)
+    spare = cores[used:]
+    if threads is None:
+        threads = max(1, len(spare) // max(n_bulk, 1))
+
+    if config.get("pin_cores") and spare and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, spare)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    return dict(config, intra_op_threads=threads, inter_op_threads=1)
+
+
+# ---------------------------------------
+# BENCHMARK
+# ---------------------------------------
+def _bench_images(image_dir, n=16):
+    from PIL import Image
+    import numpy as np
+
+    if image_dir:
+        paths = sorted(p for p in Path(image_dir).glob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png"})[:n]
+        if paths:
+            return [Image.open(p).convert("RGB") for p in paths]
+
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)) for _ in range(n)]
+
+
+def _bench_worker(threads, batch_size, seconds, image_dir, mode, barrier, results):
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    from pipeline import DamagePipeline
+    pipeline = DamagePipeline(batch_size=batch_size)
+    imgs = _bench_images(image_dir)
+
+    # fixed crops so the classifiers always run, even if YOLO finds nothing on noise
+    crops = []
+    for img in imgs:
+        w, h = img.size
+        crops.extend(img.crop((w // 4, h // 4, w // 2 + k * 10, h // 2 + k * 10)) for k in range(BOXES_PER_IMAGE))
+
+    def run_one(i):
+        img = imgs[i % len(imgs)]
+        if mode == "classify":
+            pipeline.classify(crops[:batch_size])
+            return batch_size
+        pipeline.yolo_model(img, verbose=False)
+        start = (i % len(imgs)) * BOXES_PER_IMAGE
+        pipeline.classify(crops[start:start + BOXES_PER_IMAGE])
+        return 1
+
+    for i in range(WARMUP_IMAGES):
+        run_one(i)
+
+    barrier.wait()
+    done, latencies, i = 0, [], 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        s = time.perf_counter()
+        done += run_one(i)
+        latencies.append(time.perf_counter() - s)
+        i += 1
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    results.put({
+        "throughput": done / elapsed,
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+    })
+
+
+def run_config(workers, threads, batch_size, seconds, image_dir, mode="pipeline"):
+    """Run `workers` benchmark processes concurrently; returns aggregate numbers.
+
+    Returns None if a process crashes (missing weights, OOM, ...) or does not
+    report back in time; the remaining processes are terminated.
+    """
+    import multiprocessing as mp
+    import queue
+
+    ctx = mp.get_context("spawn")   # fresh interpreter so thread settings take effect
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_bench_worker, args=(threads, batch_size, seconds, image_dir, mode, barrier, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+
+    stats, error = [], None
+    deadline = time.monotonic() + STARTUP_TIMEOUT + seconds
+    while len(stats) < workers:
+        try:
+            stats.append(results.get(timeout=1.0))
+            continue
+        except queue.Empty:
+            pass
+        crashed = [p.exitcode for p in procs if p.exitcode not in (None, 0)]
+        if crashed:
+            error = f"benchmark process exited with code {crashed[0]}"
+        elif time.monotonic() > deadline:
+            error = f"no result after {STARTUP_TIMEOUT + seconds:.0f}s"
+        if error:
+            break
+
+    for p in procs:
+        if error:
+            p.terminate()   # others may be stuck at the barrier waiting for the crashed one
+        p.join()
+    if error:
+        print(f"⚠️ workers={workers} threads={threads} batch_size={batch_size}: {error}, skipped")
+        return None
+
+    return {
+        "workers": workers,
+        "intra_op_threads": threads,
+        "batch_size": batch_size,
+        "throughput": sum(s["throughput"] for s in stats),
+        "p50_ms": max(s["p50_ms"] for s in stats),
+    }
+
+
+def candidate_grid(n_cores):
+    counts = sorted({1, 2, 4, 8, 16, n_cores} & set(range(1, n_cores + 1)))
+    grid = []
+    for workers in counts:
+        for threads in counts:
+            if workers * threads <= n_cores:
+                grid.append((workers, threads))
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU threading settings and write runtime_config.json")
+    parser.add_argument("--images", default=None, help="folder of sample images (default: synthetic)")
+    parser.add_argument("--seconds", type=float, default=BENCH_SECONDS, help="measured seconds per configuration")
+    parser.add_argument("--pin-cores", action="store_true", help="pin each server worker to its own cores")
+    parser.add_argument("--output", default=str(RUNTIME_CONFIG_PATH))
+    args = parser.parse_args()
+
+    n_cores = len(usable_cores())
+    print(f"🖥️  {n_cores} usable cores")
+
+    # 1) worker count x intra-op threads, full pipeline
+    rows = []
+    for workers, threads in candidate_grid(n_cores):
+        r = run_config(workers, threads, 8, args.seconds, args.images)
+        if r is None:
+            continue
+        rows.append(r)
+        print(f"workers={workers:2d} threads={threads:2d}: {r['throughput']:7.2f} img/s  p50={r['p50_ms']:.0f} ms")
+    if not rows:
+        print("❌ every configuration failed, runtime config not written")
+        return
+    best = max(rows, key=lambda r: r["throughput"])
+
+    # 2) classifier batch size for the winning layout
+    batch_rows = []
+    for bs in BATCH_SIZES:
+        r = run_config(best["workers"], best["intra_op_threads"], bs, args.seconds, args.images, mode="classify")
+        if r is None:
+            continue
+        batch_rows.append(r)
+        print(f"batch_size={bs:2d}: {r['throughput']:7.1f} crops/s")
+    best_bs = max(batch_rows, key=lambda r: r["throughput"])["batch_size"] if batch_rows else best["batch_size"]
+
+    config = {
+        "workers": best["workers"],
+        "intra_op_threads": best["intra_op_threads"],
+        "inter_op_threads": 1,
+        "max_concurrent_forwards": 1,   # each worker already owns its threads; more only oversubscribes
+        "classifier_batch_size": best_bs,
+        "pin_cores": bool(args.pin_cores),
+        "benchmark": {
+            "cores": n_cores,
+            "throughput_img_s": round(best["throughput"], 2),
+            "p50_ms": round(best["p50_ms"], 1),
+            "grid": rows,
+            "batch_sizes": batch_rows,
+        },
+    }
+    with open(args.output, "w") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"\n✅ best: {best['workers']} workers x {best['intra_op_threads']} threads, "
+          f"batch {best_bs} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
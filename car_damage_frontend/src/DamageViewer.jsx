@@ -97,8 +97,8 @@ function DamageViewer() {
     
     const damageDescriptions = boxes.map((b, idx) => {
       const part = b.part || b.cls || 'Unknown Part';
-      const damageType = b.damage_type || 'Unknown Type';
-      const severity = b.severity || 'Unknown Severity';
+      const damageType = b.damage_type || 'Type not assessed';
+      const severity = b.severity || 'severity not assessed';
       return `${idx + 1}. ${part} - ${damageType} (${severity})`;
     }).join('; ');
     
@@ -399,13 +399,13 @@ function DamageViewer() {
                                     Type:
                                   </Typography>
                                   <Chip 
-                                    label={b.damage_type} 
+                                    label={b.damage_type ?? 'Not assessed'} 
                                     size="small"
                                     sx={{ 
-                                      bgcolor: 'rgba(41, 121, 255, 0.15)',
-                                      color: '#2979FF',
+                                      bgcolor: b.damage_type == null ? 'rgba(113, 128, 150, 0.15)' : 'rgba(41, 121, 255, 0.15)',
+                                      color: b.damage_type == null ? '#718096' : '#2979FF',
                                       fontWeight: 600,
-                                      border: '1px solid rgba(41, 121, 255, 0.3)',
+                                      border: b.damage_type == null ? '1px solid rgba(113, 128, 150, 0.3)' : '1px solid rgba(41, 121, 255, 0.3)',
                                     }}
                                   />
                                 </Box>
@@ -418,16 +418,19 @@ function DamageViewer() {
                                     Severity:
                                   </Typography>
                                   <Chip 
-                                    label={b.severity} 
+                                    label={b.severity ?? 'Not assessed'} 
                                     size="small"
                                     sx={{ 
-                                      bgcolor: b.severity === 'severe' ? 'rgba(211, 47, 47, 0.2)' : 
+                                      bgcolor: b.severity == null ? 'rgba(113, 128, 150, 0.15)' :
+                                               b.severity === 'severe' ? 'rgba(211, 47, 47, 0.2)' : 
                                                b.severity === 'moderate' ? 'rgba(237, 108, 2, 0.2)' : 
                                                'rgba(46, 125, 50, 0.2)',
-                                      color: b.severity === 'severe' ? '#ff5252' : 
+                                      color: b.severity == null ? '#718096' :
+                                             b.severity === 'severe' ? '#ff5252' : 
                                              b.severity === 'moderate' ? '#ffa726' : '#66bb6a',
                                       fontWeight: 700,
                                       border: `1px solid ${
+                                        b.severity == null ? '#718096' :
                                         b.severity === 'severe' ? '#ff5252' : 
                                         b.severity === 'moderate' ? '#ffa726' : '#66bb6a'
                                       }`,
@@ -1,12 +1,18 @@
+import argparse
+import json
+import os
+import queue
+import threading
 
 import cv2
-import os
 
 # ---------- CONFIG ----------
 images_dir = "D:/COCO_dataset/test/images"           # folder with .jpg/.png images
 labels_dir = "D:/COCO_dataset/test/labels"           # folder with YOLO .txt labels
 output_labels_dir = "D:/COCO_dataset/test/updated_labels"  # folder to save updated labels
-os.makedirs(output_labels_dir, exist_ok=True)
+
+# Every decision is appended here, so a session can be resumed exactly where it stopped
+journal_path = os.path.join(output_labels_dir, "relabel_journal.jsonl")
 
 # Optional: Map of known class IDs to names (just for display)
 class_map = {
@@ -17,81 +23,261 @@ class_map = {
     4: "lamp broken",
     5: "tire flat"
 }
+
+DISPLAY_MAX_SIDE = 1024   # images are downscaled to this before display
+PREFETCH = 8              # images decoded ahead of the labeler
 # ----------------------------
 
-def process_image(image_path, label_path, output_label_path):
+# keys: 0-9 = new class id, Enter/Space = keep, b = back one box, q/Esc = quit
+KEEP_KEYS = {13, 10, 32}
+BACK_KEYS = {ord("b")}
+QUIT_KEYS = {ord("q"), 27}
+
+
+# ---------- HEADLESS CORE ----------
+def read_boxes(label_path):
+    """YOLO label lines with 5 fields, as (class_id, [xc, yc, w, h] tokens)."""
+    boxes = []
+    with open(label_path, "r") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) != 5:
+                continue
+            boxes.append((int(float(parts[0])), parts[1:]))
+    return boxes
+
+
+def list_items(images_dir, labels_dir):
+    """(image name, image path, label path) for every image that has a label file."""
+    items = []
+    for img_file in sorted(os.listdir(images_dir)):
+        if not (img_file.endswith(".jpg") or img_file.endswith(".png")):
+            continue
+        label_path = os.path.join(labels_dir, os.path.splitext(img_file)[0] + ".txt")
+        if os.path.exists(label_path):
+            items.append((img_file, os.path.join(images_dir, img_file), label_path))
+    return items
+
+
+def key_to_action(key):
+    """Map a cv2.waitKey code to ("set", class_id) / ("keep",) / ("back",) / ("quit",) / None."""
+    if key in KEEP_KEYS:
+        return ("keep",)
+    if key in BACK_KEYS:
+        return ("back",)
+    if key in QUIT_KEYS:
+        return ("quit",)
+    if ord("0") <= key <= ord("9"):
+        return ("set", key - ord("0"))
+    return None
+
+
+class Journal:
+    """Append-only JSON-lines log of labeling decisions; the last record per box wins."""
+
+    def __init__(self, path):
+        self.path = path
+        self.decisions = {}   # (image, box) -> class id
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue   # torn last line after a crash
+                    self.decisions[rec["image"], rec["box"]] = rec["class"]
+
+    def record(self, image, box, old_class, new_class):
+        self.decisions[image, box] = new_class
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"image": image, "box": box, "old": old_class, "class": new_class}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def decided(self, image, box):
+        return (image, box) in self.decisions
+
+    def images(self):
+        return sorted({image for image, _ in self.decisions})
+
+
+class RelabelSession:
+    """Walks the undecided boxes of one image; no display code, so it can be driven by tests."""
+
+    def __init__(self, image, boxes, journal):
+        self.image = image
+        self.boxes = boxes
+        self.journal = journal
+        self.pos = self._next_undecided(0)
+
+    def _next_undecided(self, start):
+        i = start
+        while i < len(self.boxes) and self.journal.decided(self.image, i):
+            i += 1
+        return i
+
+    @property
+    def done(self):
+        return self.pos >= len(self.boxes)
+
+    def current(self):
+        return self.pos, self.boxes[self.pos]
+
+    def handle(self, action):
+        """Apply one action; returns False when the labeler wants to quit."""
+        if action is None:
+            return True
+        if action[0] == "quit":
+            return False
+        if action[0] == "back":
+            self.pos = max(0, self.pos - 1)   # re-decide the previous box (last decision wins)
+            return True
+
+        old_class = self.boxes[self.pos][0]
+        new_class = old_class if action[0] == "keep" else action[1]
+        self.journal.record(self.image, self.pos, old_class, new_class)
+        self.pos = self._next_undecided(self.pos + 1)
+        return True
+
+
+def write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def apply_journal(journal, labels_dir, output_labels_dir):
+    """Write updated label files for every image that has decisions in the journal."""
+    os.makedirs(output_labels_dir, exist_ok=True)
+    written = changed = 0
+    for image in journal.images():
+        label_file = os.path.splitext(image)[0] + ".txt"
+        label_path = os.path.join(labels_dir, label_file)
+        if not os.path.exists(label_path):
+            print(f"⚠️ No label file for {image}")
+            continue
+
+        updated_labels = []
+        for i, (class_id, coords) in enumerate(read_boxes(label_path)):
+            new_class = journal.decisions.get((image, i), class_id)
+            changed += new_class != class_id
+            updated_labels.append(" ".join([str(new_class)] + coords) + "\n")
+
+        write_atomic(os.path.join(output_labels_dir, label_file), "".join(updated_labels))
+        written += 1
+    return written, changed
+
+
+# ---------- PREFETCH ----------
+def load_for_display(image_path, label_path):
+    """Decode, downscale and pre-draw all boxes (thin grey) once per image."""
     img = cv2.imread(image_path)
     if img is None:
-        print(f"⚠️ Could not load {image_path}")
-        return
+        return None
+    h, w = img.shape[:2]
+    scale = min(1.0, DISPLAY_MAX_SIDE / max(h, w))
+    if scale < 1.0:
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    h, w = img.shape[:2]
 
-    h, w, _ = img.shape
+    boxes = read_boxes(label_path)
+    rects = []
+    for _, coords in boxes:
+        x_center, y_center, bw, bh = map(float, coords)
+        rect = (int((x_center - bw / 2) * w), int((y_center - bh / 2) * h),
+                int((x_center + bw / 2) * w), int((y_center + bh / 2) * h))
+        rects.append(rect)
+        cv2.rectangle(img, rect[:2], rect[2:], (160, 160, 160), 1)
+    return img, boxes, rects
+
+
+class Prefetcher(threading.Thread):
+    """Decodes upcoming images in the background (cv2 releases the GIL while decoding)."""
+
+    def __init__(self, items, depth=PREFETCH):
+        super().__init__(daemon=True)
+        self.items = items
+        self.queue = queue.Queue(maxsize=depth)
+
+    def run(self):
+        try:
+            for name, image_path, label_path in self.items:
+                try:
+                    loaded = load_for_display(image_path, label_path)
+                except Exception:   # e.g. a non-numeric coordinate in the label file
+                    loaded = None   # reported and skipped by the labeler loop
+                self.queue.put((name, image_path, loaded))
+        finally:
+            self.queue.put(None)   # always end the iteration, even if this thread fails
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            yield item
 
-    if not os.path.exists(label_path):
-        print(f"⚠️ No label file for {image_path}")
-        return
-    with open(label_path, "r") as f:
-        lines = f.readlines()
 
-    updated_labels = []
+# ---------- UI ----------
+def draw_box(base, rect, class_id):
+    display_img = base.copy()   # downscaled, so this copy is cheap
+    x_min, y_min, x_max, y_max = rect
+    cv2.rectangle(display_img, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
+    label_text = f"{class_id} ({class_map.get(class_id, 'unknown')})"
+    cv2.putText(display_img, label_text, (x_min, max(15, y_min - 5)),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    return display_img
 
-    for i, line in enumerate(lines):
-        parts = line.strip().split()
-        if len(parts) != 5:
+
+def run_interactive(journal):
+    items = list_items(images_dir, labels_dir)
+    # skip fully decided images before they are even decoded
+    pending = []
+    for name, image_path, label_path in items:
+        n = len(read_boxes(label_path))
+        if not all(journal.decided(name, i) for i in range(n)):
+            pending.append((name, image_path, label_path))
+    print(f"{len(items) - len(pending)} of {len(items)} images already done, {len(pending)} to go")
+
+    prefetcher = Prefetcher(pending)
+    prefetcher.start()
+
+    for name, image_path, loaded in prefetcher:
+        if loaded is None:
+            print(f"⚠️ Could not load {image_path}")
             continue
-        class_id = int(parts[0])
-        x_center, y_center, bw, bh = map(float, parts[1:])
-
-        # Convert to pixel coords for drawing
-        x_min = int((x_center - bw / 2) * w)
-        y_min = int((y_center - bh / 2) * h)
-        x_max = int((x_center + bw / 2) * w)
-        y_max = int((y_center + bh / 2) * h)
-
-        # Copy image so each bbox is drawn fresh
-        display_img = img.copy()
-        cv2.rectangle(display_img, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
-        label_text = f"{class_id} ({class_map.get(class_id, 'unknown')})"
-        cv2.putText(display_img, label_text, (x_min, y_min - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-        # Show image
-        cv2.imshow("Labeling Tool", display_img)
-
-        print(f"Image: {os.path.basename(image_path)} | Box {i+1}/{len(lines)}")
-        print(f"Current class = {class_id} ({class_map.get(class_id, 'unknown')}), "
-              f"BBox = {x_min,y_min,x_max,y_max}")
-
-        # Ask for new class ID
-        new_class = input("Enter new class ID (or press Enter to keep same): ")
-        if new_class.strip() == "":
-            new_class = class_id
-        else:
-            new_class = int(new_class)
-
-        updated_labels.append(f"{new_class} {x_center} {y_center} {bw} {bh}\n")
-
-        # 👇 Wait for you to press a key in the window before moving on
-        cv2.waitKey(0)
-
-    # Save updated labels
-    with open(output_label_path, "w") as f:
-        f.writelines(updated_labels)
-
-    print(f"✅ Saved updated labels to {output_label_path}\n")
+        base, boxes, rects = loaded
+        session = RelabelSession(name, boxes, journal)
+
+        while not session.done:
+            i, (class_id, _) = session.current()
+            shown = journal.decisions.get((name, i), class_id)
+            cv2.imshow("Labeling Tool", draw_box(base, rects[i], shown))
+            cv2.setWindowTitle("Labeling Tool", f"{name} | box {i + 1}/{len(boxes)} | "
+                                                 f"0-9 set class, Enter keep, b back, q quit")
+            if not session.handle(key_to_action(cv2.waitKey(0) & 0xFF)):
+                cv2.destroyAllWindows()
+                print("⏸️ Session saved — run again to resume.")
+                return
+
     cv2.destroyAllWindows()
+    print("🎉 All boxes labeled! Run with --apply to write the label files.")
 
 
-# ---------- MAIN LOOP ----------
-for img_file in os.listdir(images_dir):
-    if not (img_file.endswith(".jpg") or img_file.endswith(".png")):
-        continue
+def main():
+    parser = argparse.ArgumentParser(description="Resumable YOLO class relabeling tool")
+    parser.add_argument("--apply", action="store_true", help="write updated label files from the journal")
+    args = parser.parse_args()
 
-    image_path = os.path.join(images_dir, img_file)
-    label_file = os.path.splitext(img_file)[0] + ".txt"
-    label_path = os.path.join(labels_dir, label_file)
-    output_label_path = os.path.join(output_labels_dir, label_file)
+    journal = Journal(journal_path)
+    if args.apply:
+        written, changed = apply_journal(journal, labels_dir, output_labels_dir)
+        print(f"✅ Wrote {written} label files to {output_labels_dir} ({changed} boxes changed class)")
+    else:
+        run_interactive(journal)
 
-    process_image(image_path, label_path, output_label_path)
 
-print("🎉 Done relabeling dataset!")
+if __name__ == "__main__":
+    main()
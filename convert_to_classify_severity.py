@@ -1,5 +1,10 @@
+import argparse
 import cv2
+import json
 import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # === CONFIGURATION ===
@@ -19,19 +24,32 @@ CLASS_MAP = {
 # Image extension list
 IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
 
+SPLITS = ["train", "test", "val"]
+
+# Extra context around each box, as a fraction of the box width/height per side
+PADDING = 0.0
+# Resize every crop to (width, height) so training doesn't have to; None keeps the box size
+OUTPUT_SIZE = None
+JPEG_QUALITY = 95
+
+WORKERS = os.cpu_count()
+
+# Remembers which crops each source image produced (see process_split)
+MANIFEST_NAME = ".crop_manifest.json"
+
 # Create output directories for each class under train/test/val
-def create_output_folders():
-    for split in ["train", "test", "val"]:
+def create_output_folders(output_dir=OUTPUT_DIR):
+    for split in SPLITS:
         for class_name in CLASS_MAP.values():
-            (OUTPUT_DIR / split / class_name).mkdir(parents=True, exist_ok=True)
+            (output_dir / split / class_name).mkdir(parents=True, exist_ok=True)
 
-def yolo_to_xyxy(yolo_bbox, img_w, img_h):
+def yolo_to_xyxy(yolo_bbox, img_w, img_h, padding=0.0):
     """Convert normalized YOLO (x_center, y_center, w, h) to pixel (x1, y1, x2, y2)."""
     x_center, y_center, w, h = yolo_bbox
     x_center *= img_w
     y_center *= img_h
-    w *= img_w
-    h *= img_h
+    w *= img_w * (1 + 2 * padding)
+    h *= img_h * (1 + 2 * padding)
 
     x1 = int(x_center - w / 2)
     y1 = int(y_center - h / 2)
@@ -46,15 +64,129 @@ def yolo_to_xyxy(yolo_bbox, img_w, img_h):
     return x1, y1, x2, y2
 
 
-def process_split(split_name):
+def crop_name(image_stem, line_index):
+    """Crops are named after the source image and the label line they come from."""
+    return f"{image_stem}_{line_index}.jpg"
+
+
+def read_label_lines(label_file):
+    with open(label_file, "r") as f:
+        return f.read().strip().splitlines()
+
+
+def write_atomic(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def extract_crops(image_file, label_file, output_split_dir, padding, output_size, quality):
+    """Decode one image and write all of its crops. Runs in a worker process.
+
+    Returns (crops, error) where crops is a list of [relative_path, class_name].
+    """
+    img = cv2.imread(str(image_file))
+    if img is None:
+        return [], f"Could not read {image_file}"
+
+    img_h, img_w = img.shape[:2]
+    crops = []
+
+    for line_index, line in enumerate(read_label_lines(label_file)):
+        parts = line.strip().split()
+        if len(parts) != 5:
+            continue
+
+        class_id, x_center, y_center, w, h = parts
+        if class_id not in CLASS_MAP:
+            continue
+
+        x1, y1, x2, y2 = yolo_to_xyxy(
+            (float(x_center), float(y_center), float(w), float(h)),
+            img_w, img_h, padding
+        )
+
+        cropped = img[y1:y2, x1:x2]
+        if cropped.size == 0:
+            continue
+        if output_size:
+            cropped = cv2.resize(cropped, tuple(output_size), interpolation=cv2.INTER_AREA)
+
+        ok, buf = cv2.imencode(".jpg", cropped, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            continue
+
+        class_name = CLASS_MAP[class_id]
+        rel_path = f"{class_name}/{crop_name(image_file.stem, line_index)}"
+        write_atomic(output_split_dir / rel_path, buf.tobytes())
+        crops.append([rel_path, class_name])
+
+    return crops, None
+
+
+def file_key(*paths):
+    key = []
+    for p in paths:
+        st = os.stat(p)
+        key += [st.st_mtime_ns, st.st_size]
+    return key
+
+
+def load_manifest(path):
+    if path.exists():
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(path, manifest):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def remove_unlisted_crops(output_split_dir, entries, seen):
+    """Delete <stem>_<n>.jpg crops of known source images that no manifest entry lists."""
+    stems = {Path(name).stem for name in seen}
+    listed = {c[0] for entry in entries.values() for c in entry["crops"]}
+    removed = 0
+    for class_name in CLASS_MAP.values():
+        class_dir = output_split_dir / class_name
+        if not class_dir.exists():
+            continue
+        for p in class_dir.iterdir():
+            stem, _, index = p.stem.rpartition("_")
+            if p.suffix != ".jpg" or not index.isdigit() or stem not in stems:
+                continue
+            if f"{class_name}/{p.name}" not in listed:
+                p.unlink()
+                removed += 1
+    return removed
+
+
+def process_split(split_name, pool, settings, output_dir=OUTPUT_DIR):
     image_dir = DATASET_DIR / split_name / "images"
     label_dir = DATASET_DIR / split_name / "labels"
+    output_split_dir = output_dir / split_name
 
     if not image_dir.exists() or not label_dir.exists():
         print(f"⚠️ Skipping {split_name} — missing folders.")
         return
 
-    counter = 0
+    start = time.perf_counter()
+    manifest_path = output_split_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    rebuild = manifest.get("settings") != settings
+    if rebuild:
+        # first run on this output, or padding/size changed: rebuild everything
+        manifest = {"settings": settings, "images": {}}
+    entries = manifest["images"]
+
+    counts = Counter()        # crops per class in the output (new + up to date)
+    written = Counter()       # crops per class written this run
+    todo, seen = [], set()
 
     for image_file in image_dir.glob("*"):
         if image_file.suffix.lower() not in IMAGE_EXTS:
@@ -64,50 +196,77 @@ def process_split(split_name):
         if not label_file.exists():
             continue
 
-        img = cv2.imread(str(image_file))
-        if img is None:
-            print(f"⚠️ Could not read {image_file}")
+        seen.add(image_file.name)
+        key = file_key(image_file, label_file)
+        entry = entries.get(image_file.name)
+        if entry and entry["key"] == key and all((output_split_dir / c[0]).exists() for c in entry["crops"]):
+            counts.update(c[1] for c in entry["crops"])
             continue
+        todo.append((image_file, label_file, key))
 
-        img_h, img_w = img.shape[:2]
-
-        crop_index = 0  # <-- NEW  reset for each image
+    futures = {
+        pool.submit(extract_crops, image_file, label_file, output_split_dir,
+                    settings["padding"], settings["output_size"], settings["quality"]): (image_file, key)
+        for image_file, label_file, key in todo
+    }
+    failed = 0
+    for fut in as_completed(futures):
+        image_file, key = futures[fut]
+        try:
+            crops, error = fut.result()
+        except Exception as e:   # e.g. a malformed label token; keep the rest of the split going
+            crops, error = [], f"Failed on {image_file.name}: {e!r}"
+        if error:
+            print(f"⚠️ {error}")
+            failed += 1
+            continue
 
-        with open(label_file, "r") as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) != 5:
-                    continue
+        # a changed label file can produce fewer crops than before
+        old = {c[0] for c in entries.get(image_file.name, {}).get("crops", [])}
+        for stale in old - {c[0] for c in crops}:
+            (output_split_dir / stale).unlink(missing_ok=True)
 
-                class_id, x_center, y_center, w, h = parts
-                if class_id not in CLASS_MAP:
-                    continue
+        entries[image_file.name] = {"key": key, "crops": crops}
+        counts.update(c[1] for c in crops)
+        written.update(c[1] for c in crops)
 
-                x1, y1, x2, y2 = yolo_to_xyxy(
-                    (float(x_center), float(y_center), float(w), float(h)),
-                    img_w, img_h
-                )
+    # source images that were deleted: remove their crops too
+    removed = 0
+    for name in list(entries):
+        if name not in seen:
+            for c in entries.pop(name)["crops"]:
+                (output_split_dir / c[0]).unlink(missing_ok=True)
+                removed += 1
 
-                cropped = img[y1:y2, x1:x2]
-                if cropped.size == 0:
-                    continue
+    # crops from an older run that the manifest doesn't know about (e.g. named by the
+    # old per-image crop counter instead of the label line index)
+    legacy = remove_unlisted_crops(output_split_dir, entries, seen) if rebuild else 0
 
-                class_name = CLASS_MAP[class_id]
-                output_folder = OUTPUT_DIR / split_name / class_name
+    save_manifest(manifest_path, manifest)
 
-                # save with original name + index
-                output_path = output_folder / f"{image_file.stem}_{crop_index}.jpg"
-                cv2.imwrite(str(output_path), cropped)
-                crop_index += 1
+    elapsed = time.perf_counter() - start
+    rate = len(todo) / elapsed if elapsed > 0 else 0.0
+    print(f"✅ {split_name}: {sum(counts.values())} crops from {len(seen)} images "
+          f"({sum(written.values())} written from {len(todo)} new/changed images, {rate:.1f} img/s, "
+          f"{len(seen) - len(todo)} up to date, {removed + legacy} stale crops removed, {failed} failed)")
+    for class_name in CLASS_MAP.values():
+        print(f"    {class_name:<15} {counts[class_name]:>7}  (+{written[class_name]})")
 
 
-    print(f"✅ {split_name}: saved {counter} cropped images.")
+def main():
+    parser = argparse.ArgumentParser(description="Crop YOLO boxes into a class-folder classification dataset")
+    parser.add_argument("--padding", type=float, default=PADDING, help="context around each box, fraction per side")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("W", "H"), default=OUTPUT_SIZE,
+                        help="resize crops to a fixed resolution")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
 
+    settings = {"padding": args.padding, "output_size": args.size, "quality": JPEG_QUALITY}
 
-def main():
     create_output_folders()
-    for split in ["train", "test", "val"]:
-        process_split(split)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for split in SPLITS:
+            process_split(split, pool, settings)
     print("\n🎯 Conversion complete! All crops saved in:", OUTPUT_DIR)
 
 
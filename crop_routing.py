@@ -0,0 +1,111 @@
+"""Class-aware crop scheduling: decides which YOLO boxes get which classifiers.
+
+The policy lives in crop_routing.yaml:
+  - boxes below min_confidence or min_area are dropped before classification
+  - heavily overlapping boxes of the same part are merged (class-wise NMS)
+  - per part, `classifiers` says which of severity / type run, and
+    `allowed_types` restricts the damage types that make sense for that part;
+    with a single allowed type the type classifier is skipped entirely
+"""
+from collections import Counter
+from pathlib import Path
+
+import yaml
+
+POLICY_PATH = Path(__file__).with_name("crop_routing.yaml")
+
+DEFAULT_RULE = {
+    "min_confidence": 0.0,
+    "min_area": 0.0,
+    "classifiers": ["severity", "type"],
+    "allowed_types": None,
+}
+
+
+def load_policy(path=POLICY_PATH):
+    """Read the routing policy; a missing file means 'classify every box' (old behaviour)."""
+    data = {}
+    if Path(path).exists():
+        with open(path, "r") as f:
+            data = yaml.safe_load(f) or {}
+
+    defaults = dict(DEFAULT_RULE, **(data.get("defaults") or {}))
+    parts = {}
+    for name, rule in (data.get("parts") or {}).items():
+        parts[str(name).lower()] = dict(defaults, **(rule or {}))
+    return {"merge_iou": data.get("merge_iou"), "defaults": defaults, "parts": parts}
+
+
+def rule_for(policy, part_name):
+    return policy["parts"].get(str(part_name).lower(), policy["defaults"])
+
+
+def box_iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def best_allowed_type(scores, allowed):
+    """Index of the highest type score, restricted to `allowed` type ids (None = all)."""
+    candidates = range(len(scores)) if allowed is None else allowed
+    return max(candidates, key=lambda t: float(scores[t]))
+
+
+def plan_image(boxes, parts, confs, names, img_size, policy, type_classes):
+    """Route the detections of one image.
+
+    Returns (plan, stats). `plan` has one dict per box that survives the gates, in
+    descending confidence: index into the detections, part name, and which
+    classifiers to run (`severity`, `type`) plus the allowed type ids (or None).
+    """
+    img_w, img_h = img_size
+    img_area = max(img_w * img_h, 1)
+    stats = Counter()
+
+    candidates = []
+    for i in sorted(range(len(boxes)), key=lambda k: -confs[k]):
+        part_name = names[parts[i]]
+        rule = rule_for(policy, part_name)
+        x1, y1, x2, y2 = boxes[i]
+        if confs[i] < rule["min_confidence"]:
+            stats["low_confidence"] += 1
+            continue
+        if (x2 - x1) * (y2 - y1) / img_area < rule["min_area"]:
+            stats["too_small"] += 1
+            continue
+        candidates.append((i, part_name, rule))
+
+    plan = []
+    merge_iou = policy.get("merge_iou")
+    for i, part_name, rule in candidates:
+        if merge_iou and any(
+            p["part"] == part_name and box_iou(boxes[i], boxes[p["index"]]) > merge_iou for p in plan
+        ):
+            stats["merged"] += 1
+            continue
+
+        run = set(rule["classifiers"] or [])
+        allowed = None
+        if rule["allowed_types"]:
+            allowed = [type_classes.index(t) for t in rule["allowed_types"] if t in type_classes] or None
+        run_type = "type" in run and (allowed is None or len(allowed) > 1)
+        if "type" in run and not run_type:
+            stats["type_fixed_by_rule"] += 1
+
+        plan.append({
+            "index": i,
+            "part": part_name,
+            "severity": "severity" in run,
+            "type": run_type,
+            "fixed_type": allowed[0] if "type" in run and allowed and len(allowed) == 1 else None,
+            "allowed_types": allowed,
+        })
+        if "severity" not in run:
+            stats["severity_skipped_by_rule"] += 1
+        if "type" not in run:
+            stats["type_skipped_by_rule"] += 1
+
+    return plan, stats
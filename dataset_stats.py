@@ -0,0 +1,215 @@
+"""Dataset statistics for all YOLO datasets in one pass.
+
+    python dataset_stats.py                 # all datasets, all splits
+    python dataset_stats.py --datasets types --splits train
+
+Replaces countlabels.py, severity_accuracy.py and verify_pairs.py. Label files
+are parsed in parallel with a process pool, and every parse result is stored in
+a manifest keyed by (mtime, size), so later runs only re-read files that
+changed. Reports per split:
+  - class histogram
+  - box size distribution (sqrt of normalized box area)
+  - images without labels / labels without images
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# ---------------------------------------
+# CONFIG
+DATASETS = {
+    "types":    Path(r"D:/COCO_dataset/dataset_types"),
+    "severity": Path(r"D:/COCO_dataset/dataset_severity"),
+    "parts":    Path(r"D:/COCO_dataset/dataset_parts"),
+}
+SPLITS = ["train", "val", "test"]
+
+CLASS_NAMES = {
+    "types":    ["Dent", "Scratch", "Crack", "glass shatter", "lamp broken", "tire flat"],
+    "severity": ["mild", "moderate", "severe"],
+    "parts":    ["Door", "Bumper", "Bonnet", "Glass", "Tyre", "Fender", "Lamp"],   # parts_data.yaml
+}
+
+MANIFEST_PATH = Path("dataset_stats_manifest.json")
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+
+# upper edges of the box size buckets (sqrt(w * h), normalized to the image)
+SIZE_BINS = [0.02, 0.05, 0.1, 0.2, 0.4, 0.7, 1.0]
+# ---------------------------------------
+
+
+def size_bucket(w, h):
+    side = max(w * h, 0.0) ** 0.5
+    for i, edge in enumerate(SIZE_BINS):
+        if side <= edge:
+            return i
+    return len(SIZE_BINS) - 1
+
+
+def parse_label_file(path):
+    """Parse one YOLO label file into a small, JSON-serializable summary."""
+    classes = Counter()
+    sizes = [0] * len(SIZE_BINS)
+    malformed = 0
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                try:
+                    cls_id = int(float(parts[0]))
+                    w, h = float(parts[3]), float(parts[4])
+                except (ValueError, IndexError):
+                    malformed += 1
+                    continue
+                if len(parts) != 5:
+                    malformed += 1
+                classes[cls_id] += 1
+                sizes[size_bucket(w, h)] += 1
+    except OSError:
+        malformed += 1
+    return {"classes": {str(k): v for k, v in classes.items()}, "sizes": sizes, "malformed": malformed}
+
+
+def _parse_many(paths):
+    return [(p, parse_label_file(p)) for p in paths]
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if Path(path).exists():
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("size_bins") == SIZE_BINS:
+            return manifest
+    return {"size_bins": SIZE_BINS, "files": {}}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def scan_split(split_dir):
+    """List label and image stems with one scandir per folder (no file reads)."""
+    labels, images = {}, set()
+    label_dir, image_dir = split_dir / "labels", split_dir / "images"
+    if label_dir.exists():
+        with os.scandir(label_dir) as it:
+            for e in it:
+                if e.name.endswith(".txt") and e.is_file():
+                    st = e.stat()
+                    labels[e.path] = (st.st_mtime_ns, st.st_size)
+    if image_dir.exists():
+        with os.scandir(image_dir) as it:
+            for e in it:
+                stem, ext = os.path.splitext(e.name)
+                if ext.lower() in IMAGE_EXTS:
+                    images.add(stem)
+    return labels, images, label_dir.exists(), image_dir.exists()
+
+
+def refresh_manifest(manifest, all_labels, scanned_dirs, workers):
+    """Re-parse only label files whose (mtime, size) changed. Returns the number parsed."""
+    files = manifest["files"]
+    stale = [p for p, key in all_labels.items()
+             if p not in files or files[p]["key"] != list(key)]
+    if stale:
+        chunk = 256
+        chunks = [stale[i:i + chunk] for i in range(0, len(stale), chunk)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for results in pool.map(_parse_many, chunks):
+                for p, summary in results:
+                    summary["key"] = list(all_labels[p])
+                    files[p] = summary
+
+    # forget deleted files (only in folders scanned this run)
+    for p in list(files):
+        if p not in all_labels and os.path.dirname(p) in scanned_dirs:
+            del files[p]
+    return len(stale)
+
+
+def report_split(name, split, labels, images, manifest):
+    names = CLASS_NAMES.get(name, [])
+    classes = Counter()
+    sizes = [0] * len(SIZE_BINS)
+    malformed = 0
+    for p in labels:
+        summary = manifest["files"][p]
+        for k, v in summary["classes"].items():
+            classes[int(k)] += v
+        sizes = [a + b for a, b in zip(sizes, summary["sizes"])]
+        malformed += summary["malformed"]
+
+    label_stems = {Path(p).stem for p in labels}
+    no_label = sorted(images - label_stems)
+    no_image = sorted(label_stems - images)
+
+    total = sum(classes.values())
+    print(f"\n=== {name.upper()} / {split.upper()} ===")
+    print(f"  images: {len(images)}  label files: {len(labels)}  boxes: {total}  malformed lines: {malformed}")
+
+    if total:
+        print("  🔹 Class distribution:")
+        for cls_id, freq in sorted(classes.items()):
+            label = names[cls_id] if 0 <= cls_id < len(names) else "UNKNOWN"
+            print(f"    {cls_id:>3} {label:<15} {freq:>8} ({freq / total:.2%})")
+
+        print("  🔹 Box size (sqrt of normalized area):")
+        lo = 0.0
+        for edge, n in zip(SIZE_BINS, sizes):
+            print(f"    {lo:4.2f}-{edge:4.2f}  {n:>8} ({n / total:.2%})")
+            lo = edge
+    else:
+        print("  ❌ NO LABELS FOUND.")
+
+    if no_label or no_image:
+        print(f"  ⚠️ images without labels: {len(no_label)}   labels without images: {len(no_image)}")
+        for stem in no_label[:5]:
+            print(f"    - no label:  {stem}")
+        for stem in no_image[:5]:
+            print(f"    - no image:  {stem}")
+    else:
+        print("  ✅ every image has a label file and vice versa")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Class, box size and pairing statistics for the YOLO datasets")
+    parser.add_argument("--datasets", nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--manifest", default=str(MANIFEST_PATH))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    scans = {}
+    all_labels = {}
+    for name in args.datasets:
+        for split in args.splits:
+            scans[name, split] = scan_split(DATASETS[name] / split)
+            all_labels.update(scans[name, split][0])
+
+    manifest = load_manifest(args.manifest)
+    scanned_dirs = {str(DATASETS[name] / split / "labels") for name, split in scans}
+    parsed = refresh_manifest(manifest, all_labels, scanned_dirs, args.workers)
+    save_manifest(manifest, args.manifest)
+
+    for (name, split), (labels, images, has_labels, has_images) in scans.items():
+        if not has_labels and not has_images:
+            print(f"\n⚠️ No {split} folder found in {name}")
+            continue
+        report_split(name, split, labels, images, manifest)
+
+    elapsed = time.perf_counter() - start
+    print(f"\n🎯 {len(all_labels)} label files, {parsed} re-parsed, {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
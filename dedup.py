@@ -0,0 +1,311 @@
+"""Near-duplicate and cross-split leakage detection with a perceptual-hash index.
+
+    python dedup.py                                  # report only
+    python dedup.py --max-distance 4                 # stricter matching
+    python dedup.py --quarantine D:/COCO_dataset/quarantine
+    python dedup.py --benchmark 100000               # search speed on random hashes
+
+Every image of every split gets a 64-bit pHash (image_hash.py), computed in a
+process pool and cached in <dataset>/phash_index.npz keyed by (mtime, size), so
+only new or changed images are hashed again.
+
+Near-duplicates are found with multi-index hashing instead of comparing every
+pair: the 64 bits are cut into 4 blocks of 16 bits, and two hashes within
+max_distance bits must be within max_distance // 4 bits on at least one block.
+Each hash looks up the sorted block values at that sub-radius, and candidates
+are filtered by exact Hamming distance (popcount lookup table) chunk by chunk.
+
+Pairs that span two splits are leaks. With --quarantine, the copy in the later
+split (val before test, both after train) is moved out with its label file.
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from image_hash import phash_file
+
+# ---------------------------------------
+# CONFIG
+DATASETS = {
+    "types":    Path(r"D:/COCO_dataset/dataset_types"),
+    "severity": Path(r"D:/COCO_dataset/dataset_severity"),
+    "parts":    Path(r"D:/COCO_dataset/dataset_parts"),
+}
+SPLITS = ["train", "val", "test"]     # earlier split wins when quarantining
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+
+INDEX_NAME = "phash_index.npz"
+REPORT_NAME = "dedup_report.json"
+MAX_DISTANCE = 6                      # bits; 0 = exact pHash match only
+MIH_BLOCKS = 4                        # 16-bit blocks, searched at radius max_distance // 4
+MAX_CANDIDATES = 1_000_000            # candidate pairs held in memory at once
+# ---------------------------------------
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# ---------------------------------------
+# INDEX
+# ---------------------------------------
+def list_images(root):
+    paths, splits, keys = [], [], []
+    for split in SPLITS:
+        image_dir = root / split / "images"
+        if not image_dir.exists():
+            continue
+        with os.scandir(image_dir) as it:
+            for e in it:
+                if os.path.splitext(e.name)[1].lower() in IMAGE_EXTS:
+                    st = e.stat()
+                    paths.append(e.path)
+                    splits.append(split)
+                    keys.append((st.st_mtime_ns, st.st_size))
+    return paths, splits, keys
+
+
+def update_index(root, workers):
+    """Load the cached index, hash new/changed images, drop deleted ones."""
+    index_path = root / INDEX_NAME
+    cached = {}
+    if index_path.exists():
+        data = np.load(index_path, allow_pickle=False)
+        for p, k, h in zip(data["paths"], data["keys"], data["hashes"]):
+            cached[str(p)] = (tuple(int(x) for x in k), int(h))
+
+    paths, splits, keys = list_images(root)
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    valid = np.ones(len(paths), dtype=bool)
+    todo = []
+    for i, (p, k) in enumerate(zip(paths, keys)):
+        hit = cached.get(p)
+        if hit and hit[0] == k:
+            hashes[i] = hit[1]
+        else:
+            todo.append(i)
+
+    if todo:
+        print(f"  hashing {len(todo)} new/changed images ({len(paths) - len(todo)} cached)")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for i, h in zip(todo, pool.map(phash_file, [paths[i] for i in todo], chunksize=64)):
+                if h is None:
+                    valid[i] = False
+                    print(f"⚠️ Could not read {paths[i]}")
+                else:
+                    hashes[i] = h
+
+    paths = [p for p, ok in zip(paths, valid) if ok]
+    splits = [s for s, ok in zip(splits, valid) if ok]
+    keys = np.array([k for k, ok in zip(keys, valid) if ok], dtype=np.int64).reshape(-1, 2)
+    hashes = hashes[valid]
+
+    tmp = root / (INDEX_NAME + ".tmp.npz")
+    np.savez(tmp, paths=np.array(paths, dtype=str), keys=keys, hashes=hashes)
+    os.replace(tmp, index_path)
+    return paths, np.array(splits, dtype=str), hashes
+
+
+# ---------------------------------------
+# SEARCH
+# ---------------------------------------
+def hamming_distance(a, b):
+    """Element-wise Hamming distance of two uint64 arrays."""
+    x = np.bitwise_xor(a, b)
+    return _POPCOUNT[x.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _flip_masks(bits, radius):
+    """Every bit pattern of width `bits` with at most `radius` bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for combo in itertools.combinations(range(bits), r):
+            masks.append(sum(1 << b for b in combo))
+    return np.array(masks, dtype=np.uint64)
+
+
+def near_duplicate_pairs(hashes, max_distance, n_blocks=MIH_BLOCKS, stats=None):
+    """All index pairs (i < j) whose hashes are within max_distance bits.
+
+    Multi-index hashing: the 64 bits are cut into n_blocks wide blocks. Any pair
+    within max_distance bits has at least one block within max_distance // n_blocks
+    bits, so each hash only looks up the buckets at that sub-radius around its own
+    block values. Candidates are generated and Hamming-filtered in chunks of at
+    most MAX_CANDIDATES, so memory does not grow with the bucket sizes.
+    """
+    n = len(hashes)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    n_blocks = max(1, min(n_blocks, max_distance + 1))
+    radius = max_distance // n_blocks
+    edges = np.linspace(0, 64, n_blocks + 1).astype(int)
+    blocks = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        mask = np.uint64((1 << int(hi - lo)) - 1)
+        blocks.append((hashes >> np.uint64(lo)) & mask)
+
+    found_pairs, found_dist = [], []
+    for b, (block, width) in enumerate(zip(blocks, np.diff(edges))):
+        order = np.argsort(block, kind="stable")
+        sorted_block = block[order]
+        for flip in _flip_masks(int(width), radius):
+            target = block ^ flip
+            starts = np.searchsorted(sorted_block, target, side="left")
+            counts = np.searchsorted(sorted_block, target, side="right") - starts
+            if not counts.any():
+                continue
+
+            # walk the queries in ranges whose buckets hold at most MAX_CANDIDATES entries
+            cum = np.cumsum(counts)
+            q = 0
+            while q < n:
+                base = cum[q - 1] if q else 0
+                q_end = max(int(np.searchsorted(cum, base + MAX_CANDIDATES, side="right")), q + 1)
+                c = counts[q:q_end]
+                total = int(c.sum())
+                if total:
+                    qi = np.repeat(np.arange(q, q_end), c)
+                    offsets = np.arange(total) - np.repeat(np.cumsum(c) - c, c)
+                    j = order[np.repeat(starts[q:q_end], c) + offsets]
+
+                    keep = qi < j
+                    # a pair close enough in an earlier block was already reported there
+                    for prev in blocks[:b]:
+                        keep &= hamming_distance(prev[qi], prev[j]) > radius
+                    qi, j = qi[keep], j[keep]
+                    dist = hamming_distance(hashes[qi], hashes[j])
+                    keep = dist <= max_distance
+                    found_pairs.append(np.stack([qi[keep], j[keep]], axis=1))
+                    found_dist.append(dist[keep].astype(np.int64))
+                    if stats is not None:
+                        stats["candidates"] += total
+                        stats["peak_chunk"] = max(stats["peak_chunk"], total)
+                q = q_end
+
+    if not found_pairs:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(found_pairs).astype(np.int64), np.concatenate(found_dist)
+
+
+def benchmark(n, max_distance, planted=1000, seed=0):
+    """Search time and candidate volume on n random hashes with planted near-duplicates."""
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, 2 ** 64, size=n, dtype=np.uint64)
+    planted = min(planted, n // 2)
+    src = rng.choice(n, size=planted, replace=False)
+    dst = rng.choice(np.setdiff1d(np.arange(n), src), size=planted, replace=False)
+    for s, d in zip(src, dst):
+        flips = rng.choice(64, size=rng.integers(0, max_distance + 1), replace=False)
+        hashes[d] = hashes[s] ^ np.uint64(sum(1 << int(f) for f in flips))
+
+    stats = Counter()
+    start = time.perf_counter()
+    pairs, _ = near_duplicate_pairs(hashes, max_distance, stats=stats)
+    elapsed = time.perf_counter() - start
+
+    found = {(int(i), int(j)) for i, j in pairs}
+    missed = sum((min(s, d), max(s, d)) not in found for s, d in zip(src, dst))
+    print(f"  {n} hashes, ≤{max_distance} bits: {len(pairs)} pairs in {elapsed:.2f}s, "
+          f"{stats['candidates']} candidates compared (largest chunk {stats['peak_chunk']})")
+    if missed:
+        print(f"  ❌ {missed} of {planted} planted pairs missed")
+    else:
+        print(f"  ✅ all {planted} planted pairs found")
+    return elapsed, stats, missed
+
+
+# ---------------------------------------
+# QUARANTINE
+# ---------------------------------------
+def quarantine_image(image_path, split, root, dest):
+    image_path = Path(image_path)
+    label_path = root / split / "labels" / (image_path.stem + ".txt")
+    for src, kind in ((image_path, "images"), (label_path, "labels")):
+        if src.exists():
+            target = dest / split / kind
+            target.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(src), str(target / src.name))
+
+
+def process_dataset(name, root, max_distance, workers, quarantine):
+    print(f"\n📁 {name}: {root}")
+    start = time.perf_counter()
+    paths, splits, hashes = update_index(root, workers)
+    pairs, dist = near_duplicate_pairs(hashes, max_distance)
+
+    rank = {s: i for i, s in enumerate(SPLITS)}
+    within, leaks = Counter(), []
+    for (i, j), d in zip(pairs, dist):
+        a, b = splits[i], splits[j]
+        if a == b:
+            within[a] += 1
+            continue
+        # keep the image from the earlier split, flag the later one
+        if rank[a] > rank[b]:
+            i, j, a, b = j, i, b, a
+        leaks.append({"keep": paths[i], "keep_split": a, "leak": paths[j], "leak_split": b, "distance": int(d)})
+
+    print(f"  {len(paths)} images, {len(pairs)} near-duplicate pairs "
+          f"(≤{max_distance} bits) in {time.perf_counter() - start:.1f}s")
+    for split in SPLITS:
+        if within[split]:
+            print(f"  {split}: {within[split]} pairs inside the split")
+    leak_counts = Counter(f"{l['keep_split']}->{l['leak_split']}" for l in leaks)
+    if leaks:
+        print(f"  ❌ {len(leaks)} cross-split leaks: " + ", ".join(f"{k}: {v}" for k, v in leak_counts.items()))
+    else:
+        print("  ✅ no cross-split leakage")
+
+    moved = 0
+    if quarantine and leaks:
+        dest = Path(quarantine) / name
+        for path, split in sorted({(l["leak"], l["leak_split"]) for l in leaks}):
+            if Path(path).exists():
+                quarantine_image(path, split, root, dest)
+                moved += 1
+        print(f"  🚚 moved {moved} leaked images (with labels) to {dest}")
+
+    report = {
+        "dataset": name,
+        "images": len(paths),
+        "max_distance": max_distance,
+        "pairs_within_split": dict(within),
+        "leaks": leaks,
+        "quarantined": moved,
+    }
+    with open(root / REPORT_NAME, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"  📄 report: {root / REPORT_NAME}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images and train/val/test leakage")
+    parser.add_argument("--datasets", nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE, help="max Hamming distance in bits")
+    parser.add_argument("--quarantine", default=None, help="move leaked val/test images here")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--benchmark", type=int, default=None, metavar="N",
+                        help="time the search on N random hashes instead of scanning datasets")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.max_distance)
+        return
+
+    for name in args.datasets:
+        root = DATASETS[name]
+        if not root.exists():
+            print(f"⚠️ Skipping {name} — missing {root}")
+            continue
+        process_dataset(name, root, args.max_distance, args.workers, args.quarantine)
+
+
+if __name__ == "__main__":
+    main()
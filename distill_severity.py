@@ -0,0 +1,262 @@
+"""Distill the convnext_base severity classifier into a small CPU-friendly student.
+
+    python distill_severity.py                                  # mobilenetv3_large_100 student
+    python distill_severity.py --student efficientnet_b0 --epochs 30
+
+The teacher is the deployed severity model from pipeline.py. Its logits on the
+(un-augmented) crops are computed once and cached on disk, keyed by the teacher
+weights and the crop files (path, label, mtime, size), so training epochs only
+run the student and rebuilt crops get fresh logits.
+
+The loss is the usual Hinton mix:
+    alpha * T^2 * KL(softmax(teacher / T) || softmax(student / T)) + (1 - alpha) * CE(student, label)
+Only horizontal flips are used as augmentation, since the cached teacher logits
+belong to the unmodified crop. Crops are decoded and resized exactly like
+pipeline.tfm does at serving time (PIL RGB, its Resize transform), so teacher
+logits, training and the test comparison all see serving inputs.
+
+The student checkpoint is picked on the val split; the teacher and that student
+are then compared on the held-out test split for accuracy and per-crop CPU
+latency, and the result is written to a JSON report.
+To serve the student, set severity_arch / severity_model_path in pipeline.py.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import timm
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+import pipeline
+from augmentation import CropFolderDataset, balanced_sampler
+from pack_shards import collate_uint8, normalize_batch
+
+# ---------------------------------------
+# CONFIG
+CROPS_DIR = Path(r"D:\COCO_dataset\severity_classification")   # <split>/<class>/*.jpg
+CACHE_DIR = Path("distill_cache")
+
+STUDENT_ARCH = "mobilenetv3_large_100"
+EPOCHS = 20
+BATCH_SIZE = 64
+LR = 1e-3
+WEIGHT_DECAY = 0.05
+TEMPERATURE = 4.0
+ALPHA = 0.7
+NUM_WORKERS = 4
+
+LATENCY_RUNS = 50
+# ---------------------------------------
+
+
+class ServingCropDataset(CropFolderDataset):
+    """CropFolderDataset decoded with PIL and resized by pipeline.tfm's own Resize."""
+
+    resize = pipeline.tfm.transforms[0]
+
+    def __getitem__(self, i):
+        path, label = self.samples[i]
+        with Image.open(path) as img:
+            img = self.resize(img.convert("RGB"))
+        return np.asarray(img), label
+
+
+class IndexedDataset(Dataset):
+    """Adds the sample index so cached teacher logits can be looked up per batch."""
+
+    def __init__(self, base):
+        self.base = base
+
+    def __len__(self):
+        return len(self.base)
+
+    def __getitem__(self, i):
+        img, label = self.base[i]
+        return img, label, i
+
+
+def collate_indexed(batch):
+    images, labels = collate_uint8([(b[0], b[1]) for b in batch])
+    return images, labels, torch.tensor([b[2] for b in batch], dtype=torch.long)
+
+
+def load_teacher():
+    return pipeline.load_classifier(pipeline.severity_arch, len(pipeline.severity_classes),
+                                    pipeline.severity_model_path)
+
+
+def teacher_logits(teacher, dataset, split, batch_size, workers):
+    """Teacher logits for every sample of `dataset`, cached in CACHE_DIR."""
+    st = os.stat(pipeline.severity_model_path)
+    h = hashlib.sha1()
+    h.update(f"{pipeline.severity_arch}:{st.st_mtime_ns}:{st.st_size}:"
+             f"{type(dataset).__name__}:{dataset.size}".encode())
+    for path, label in dataset.samples:
+        st = os.stat(path)
+        h.update(f"{path}:{label}:{st.st_mtime_ns}:{st.st_size}".encode())
+    cache_file = CACHE_DIR / f"teacher_{split}_{h.hexdigest()[:16]}.npy"
+    if cache_file.exists():
+        print(f"  teacher logits for {split}: cached ({cache_file})")
+        return torch.from_numpy(np.load(cache_file))
+
+    print(f"  computing teacher logits for {split} ({len(dataset)} crops, runs once)")
+    loader = DataLoader(dataset, batch_size=batch_size, num_workers=workers, collate_fn=collate_uint8)
+    out = []
+    with torch.no_grad():
+        for images, _ in loader:
+            out.append(teacher(normalize_batch(images.to(pipeline.device))).float().cpu())
+    logits = torch.cat(out)
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = cache_file.with_suffix(".tmp.npy")
+    np.save(tmp, logits.numpy())
+    os.replace(tmp, cache_file)
+    return logits
+
+
+def distill_loss(student_logits, teacher_logits, labels, temperature, alpha):
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.softmax(teacher_logits / temperature, dim=1),
+        reduction="batchmean",
+    ) * temperature ** 2
+    return alpha * soft + (1 - alpha) * F.cross_entropy(student_logits, labels)
+
+
+def evaluate(model, loader):
+    model.eval()
+    correct = total = 0
+    with torch.no_grad():
+        for images, labels in loader:
+            pred = model(normalize_batch(images.to(pipeline.device))).argmax(dim=1).cpu()
+            correct += (pred == labels).sum().item()
+            total += len(labels)
+    return correct / max(total, 1)
+
+
+def cpu_latency_ms(model, batch_size, runs=LATENCY_RUNS):
+    """Median CPU latency per crop for a given batch size."""
+    model = model.to("cpu").eval()
+    x = torch.randn(batch_size, 3, 224, 224)
+    times = []
+    with torch.no_grad():
+        for _ in range(5):
+            model(x)
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            model(x)
+            times.append(time.perf_counter() - t0)
+    times.sort()
+    return 1000 * times[len(times) // 2] / batch_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the severity classifier into a small student")
+    parser.add_argument("--crops", default=str(CROPS_DIR), help="severity crop dataset (<split>/<class>/*.jpg)")
+    parser.add_argument("--student", default=STUDENT_ARCH, help="timm architecture of the student")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--lr", type=float, default=LR)
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE)
+    parser.add_argument("--alpha", type=float, default=ALPHA, help="weight of the distillation term")
+    parser.add_argument("--balanced", action="store_true", help="class-balanced sampling")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--output", default=None, help="student weights (default: severity_<arch>_distilled.pth)")
+    args = parser.parse_args()
+
+    output = args.output or f"severity_{args.student}_distilled.pth"
+    crops = Path(args.crops)
+    classes = pipeline.severity_classes
+    train_set = ServingCropDataset(crops / "train", classes=classes)
+    val_set = ServingCropDataset(crops / "val", classes=classes)
+    if not (crops / "test").exists():
+        print(f"⚠️ Missing {crops / 'test'} — a held-out test split is needed for the final comparison")
+        return
+    test_set = ServingCropDataset(crops / "test", classes=classes)
+    print(f"📂 train: {len(train_set)} crops, val: {len(val_set)} crops, test: {len(test_set)} crops, "
+          f"classes: {classes}")
+
+    teacher = load_teacher()
+    train_logits = teacher_logits(teacher, train_set, "train", args.batch_size, args.workers)
+
+    # val picks the student checkpoint; test is only used for the final report
+    val_loader = DataLoader(val_set, batch_size=args.batch_size, num_workers=args.workers,
+                            collate_fn=collate_uint8)
+    test_loader = DataLoader(test_set, batch_size=args.batch_size, num_workers=args.workers,
+                             collate_fn=collate_uint8)
+    test_teacher = teacher_logits(teacher, test_set, "test", args.batch_size, args.workers)
+    teacher_acc = (test_teacher.argmax(dim=1) == torch.tensor(test_set.targets)).float().mean().item()
+
+    sampler = balanced_sampler(train_set.targets) if args.balanced else None
+    train_loader = DataLoader(
+        IndexedDataset(train_set), batch_size=args.batch_size, shuffle=sampler is None, sampler=sampler,
+        num_workers=args.workers, collate_fn=collate_indexed, drop_last=True,
+        persistent_workers=args.workers > 0,
+    )
+
+    student = timm.create_model(args.student, pretrained=True, num_classes=len(classes)).to(pipeline.device)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr, weight_decay=WEIGHT_DECAY)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs * len(train_loader))
+
+    best_acc = -1.0
+    for epoch in range(args.epochs):
+        student.train()
+        start, running = time.perf_counter(), 0.0
+        for images, labels, idx in train_loader:
+            flip = torch.rand(len(images)) < 0.5
+            images[flip] = images[flip].flip(-1)
+
+            x = normalize_batch(images.to(pipeline.device))
+            loss = distill_loss(student(x), train_logits[idx].to(pipeline.device),
+                                labels.to(pipeline.device), args.temperature, args.alpha)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            running += loss.item()
+
+        acc = evaluate(student, val_loader)
+        print(f"epoch {epoch + 1}/{args.epochs}: loss {running / max(len(train_loader), 1):.4f}  "
+              f"val acc {acc:.4f}  ({time.perf_counter() - start:.0f}s)")
+        if acc > best_acc:
+            best_acc = acc
+            torch.save(student.state_dict(), output)
+
+    # ---------- accuracy / latency trade-off ----------
+    student.load_state_dict(torch.load(output, map_location=pipeline.device))
+    student_acc = evaluate(student, test_loader)
+    report = {
+        "teacher": {"arch": pipeline.severity_arch, "test_acc": teacher_acc,
+                    "cpu_ms_per_crop_b1": cpu_latency_ms(teacher, 1),
+                    "cpu_ms_per_crop_b8": cpu_latency_ms(teacher, 8)},
+        "student": {"arch": args.student, "weights": output, "val_acc": best_acc, "test_acc": student_acc,
+                    "cpu_ms_per_crop_b1": cpu_latency_ms(student, 1),
+                    "cpu_ms_per_crop_b8": cpu_latency_ms(student, 8)},
+        "cpu_threads": torch.get_num_threads(),
+    }
+    speedup = report["teacher"]["cpu_ms_per_crop_b1"] / report["student"]["cpu_ms_per_crop_b1"]
+    report["speedup_b1"] = speedup
+
+    report_path = Path(output).with_suffix(".json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n=== ACCURACY / LATENCY (test, CPU) ===")
+    for role in ("teacher", "student"):
+        r = report[role]
+        print(f"  {role:<8} {r['arch']:<24} acc {r['test_acc']:.4f}   "
+              f"{r['cpu_ms_per_crop_b1']:.1f} ms/crop (b1)   {r['cpu_ms_per_crop_b8']:.1f} ms/crop (b8)")
+    print(f"  speedup: {speedup:.1f}x   accuracy change: {student_acc - teacher_acc:+.4f}")
+    print(f"\n✅ student saved to {output}, report in {report_path}")
+    print(f'   to serve it: severity_arch = "{args.student}", severity_model_path = "{output}" in pipeline.py')
+
+
+if __name__ == "__main__":
+    main()
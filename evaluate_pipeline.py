@@ -0,0 +1,366 @@
+"""Offline evaluation of the deployed YOLO -> severity -> type pipeline.
+
+    python evaluate_pipeline.py --split test
+    python evaluate_pipeline.py --split test --conf 0.4 --iou 0.6   # re-run from cache in seconds
+    python evaluate_pipeline.py --split test --throughput 200        # also time the deployed pipeline
+
+Streams a YOLO-format split (images/ + labels/) through pipeline.DamagePipeline
+with a multi-worker DataLoader and batched inference. Each dataset's labels are
+compared against the matching pipeline output: part ids for dataset_parts,
+severity for dataset_severity and damage type for dataset_types.
+
+Reports go through the same routing policy as /predict (crop_routing.yaml: gates,
+merging, per-part classifiers, allowed types), applied to the cached raw output.
+
+Predicted boxes are matched to ground-truth boxes by IoU, class-agnostically, so
+a right box with the wrong class shows up in the confusion matrix instead of as
+a miss. The last row/column ("bg") counts missed boxes and false detections.
+
+Raw per-image predictions (all boxes above a very low YOLO confidence) are
+cached per split, keyed by image mtime/size and the model weights, so changing
+--conf or --iou does not re-run inference. Only boxes above CLASSIFY_CONF (at
+most MAX_CLASSIFIED_BOXES per image) are classified when filling the cache, so
+severity/type reports use a --conf of at least CLASSIFY_CONF.
+
+Throughput is measured separately with DamagePipeline.predict_images, i.e. the
+deployed thresholds and routing policy, on the first --throughput images of the
+first dataset. It is opt-in, so report re-runs never load the models.
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+import crop_routing
+
+# ---------------------------------------
+# CONFIG
+DATASETS = {
+    # name: (root containing train/val/test, pipeline field the labels describe)
+    "parts":    (Path(r"D:/COCO_dataset/dataset_parts"), "part"),
+    "severity": (Path(r"D:/COCO_dataset/dataset_severity"), "severity"),
+    "types":    (Path(r"D:/COCO_dataset/dataset_types"), "type"),
+}
+CACHE_DIR = Path("eval_cache")
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+CACHE_CONF = 0.001      # YOLO threshold used when filling the cache
+CLASSIFY_CONF = 0.1     # boxes below this are cached without classifier probabilities
+MAX_CLASSIFIED_BOXES = 50   # per image, highest confidence first
+CONF_THRESHOLD = 0.25   # default threshold applied at report time
+IOU_THRESHOLD = 0.5
+BATCH_SIZE = 16
+NUM_WORKERS = 4
+# ---------------------------------------
+
+
+# ---------------------------------------
+# DATA
+# ---------------------------------------
+class ImageListDataset:
+    """Decodes images in DataLoader workers; yields (path, PIL image)."""
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        from PIL import Image
+        path = self.paths[i]
+        try:
+            return str(path), Image.open(path).convert("RGB")
+        except Exception:
+            return str(path), None
+
+
+def collate_list(batch):
+    return batch
+
+
+def read_labels(label_file, img_w, img_h):
+    """YOLO label file -> (class ids, pixel xyxy boxes)."""
+    classes, boxes = [], []
+    if not label_file.exists():
+        return classes, boxes
+    with open(label_file, "r") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) != 5:
+                continue
+            cls_id = int(float(parts[0]))
+            xc, yc, w, h = map(float, parts[1:])
+            classes.append(cls_id)
+            boxes.append([(xc - w / 2) * img_w, (yc - h / 2) * img_h,
+                          (xc + w / 2) * img_w, (yc + h / 2) * img_h])
+    return classes, boxes
+
+
+# ---------------------------------------
+# CACHE
+# ---------------------------------------
+def model_fingerprint():
+    import pipeline
+    parts = []
+    for path in (pipeline.yolo_model_path, pipeline.severity_model_path, pipeline.type_model_path):
+        st = os.stat(path)
+        parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+    parts.append(f"classify>={CLASSIFY_CONF}:max{MAX_CLASSIFIED_BOXES}")
+    return "|".join(parts)
+
+
+def file_key(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def load_cache(cache_file, fingerprint):
+    if cache_file.exists():
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+        if cache.get("fingerprint") == fingerprint:
+            return cache
+        print("♻️  model weights or cache settings changed, discarding cached predictions")
+    return {"fingerprint": fingerprint, "part_names": None, "images": {}}
+
+
+def save_cache(cache_file, cache):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_file.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, cache_file)
+
+
+def stale_images(image_paths, cache):
+    todo = []
+    for p in image_paths:
+        entry = cache["images"].get(str(p))
+        if entry is None or entry["key"] != file_key(p):
+            todo.append(p)
+    return todo
+
+
+def run_inference(pipeline, todo, cache, cache_file, batch_size, num_workers):
+    """Fill the cache for images that are new or changed."""
+    from torch.utils.data import DataLoader
+
+    cache["part_names"] = {int(k): v for k, v in pipeline.yolo_model.names.items()}
+
+    loader = DataLoader(ImageListDataset(todo), batch_size=batch_size, num_workers=num_workers,
+                        collate_fn=collate_list)
+    print(f"🔎 running pipeline on {len(todo)} images ({len(cache['images'])} cached)")
+
+    done = 0
+    for batch in loader:
+        batch = [(p, img) for p, img in batch if img is not None]
+        if not batch:
+            continue
+        raw = pipeline.detect_and_classify([img for _, img in batch], conf=CACHE_CONF,
+                                           classify_conf=CLASSIFY_CONF, max_boxes=MAX_CLASSIFIED_BOXES)
+        for (path, img), r in zip(batch, raw):
+            r["key"] = file_key(path)
+            r["size"] = list(img.size)
+            cache["images"][path] = r
+        done += len(batch)
+        if done % (batch_size * 50) < batch_size:
+            save_cache(cache_file, cache)   # checkpoint long runs
+    save_cache(cache_file, cache)
+
+
+def measure_throughput(pipeline, image_paths, batch_size, num_workers):
+    """Images/s of pipeline.predict_images (deployed thresholds and routing), decode excluded."""
+    from torch.utils.data import DataLoader
+
+    loader = DataLoader(ImageListDataset(image_paths), batch_size=batch_size, num_workers=num_workers,
+                        collate_fn=collate_list)
+    done, elapsed = 0, 0.0
+    for batch in loader:
+        imgs = [img for _, img in batch if img is not None]
+        if not imgs:
+            continue
+        start = time.perf_counter()
+        pipeline.predict_images(imgs)
+        elapsed += time.perf_counter() - start
+        done += len(imgs)
+    return done, elapsed
+
+
+# ---------------------------------------
+# METRICS
+# ---------------------------------------
+def box_iou(a, b):
+    """IoU matrix between (N,4) and (M,4) xyxy arrays."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def routed_predictions(entry, field, part_names, policy, type_classes, conf_thr):
+    """(detection index, predicted class) for every box the deployed pipeline would report.
+
+    Applies the same crop_routing plan (gates, merging, per-part classifiers) and
+    allowed-type masking as DamagePipeline to the cached raw detections. Boxes
+    whose classifier the policy skips, or that were not classified when filling
+    the cache, are left out of the severity/type predictions.
+    """
+    idx = [k for k, c in enumerate(entry["confs"]) if c >= conf_thr]
+    plan, _ = crop_routing.plan_image([entry["boxes"][k] for k in idx], [entry["parts"][k] for k in idx],
+                                      [entry["confs"][k] for k in idx], part_names, entry["size"],
+                                      policy, type_classes)
+    out = []
+    for p in plan:
+        k = idx[p["index"]]
+        if field == "part":
+            out.append((k, entry["parts"][k]))
+        elif field == "severity":
+            probs = entry["severity_probs"][k]
+            if p["severity"] and probs is not None:
+                out.append((k, int(np.argmax(probs))))
+        elif p["fixed_type"] is not None:
+            out.append((k, p["fixed_type"]))
+        elif p["type"] and entry["type_probs"][k] is not None:
+            out.append((k, crop_routing.best_allowed_type(entry["type_probs"][k], p["allowed_types"])))
+    return out
+
+
+def update_confusion(cm, gt_cls, gt_boxes, pred_cls, pred_boxes, pred_conf, iou_thr):
+    """Greedy matching by descending confidence; last index of cm is background."""
+    bg = cm.shape[0] - 1
+    matched = set()
+    ious = box_iou(pred_boxes, gt_boxes) if gt_boxes and pred_boxes else None
+
+    for i in np.argsort(pred_conf)[::-1]:
+        best, best_iou = None, iou_thr
+        if ious is not None:
+            for j in range(len(gt_boxes)):
+                if j not in matched and ious[i, j] >= best_iou:
+                    best, best_iou = j, ious[i, j]
+        p = min(pred_cls[i], bg)
+        if best is None:
+            cm[bg, p] += 1
+        else:
+            matched.add(best)
+            cm[min(gt_cls[best], bg), p] += 1
+
+    for j, g in enumerate(gt_cls):
+        if j not in matched:
+            cm[min(g, bg), bg] += 1
+
+
+def evaluate(cache, label_dir, image_paths, field, n_classes, conf_thr, iou_thr, policy, type_classes):
+    cm = np.zeros((n_classes + 1, n_classes + 1), dtype=np.int64)
+    part_names = {int(k): v for k, v in (cache["part_names"] or {}).items()}
+    for p in image_paths:
+        entry = cache["images"].get(str(p))
+        if entry is None:
+            continue
+        w, h = entry["size"]
+        gt_cls, gt_boxes = read_labels(label_dir / (p.stem + ".txt"), w, h)
+
+        preds = routed_predictions(entry, field, part_names, policy, type_classes, conf_thr)
+        pred_cls = [c for _, c in preds]
+        pred_boxes = [entry["boxes"][k] for k, _ in preds]
+        pred_conf = np.array([entry["confs"][k] for k, _ in preds])
+        update_confusion(cm, gt_cls, gt_boxes, pred_cls, pred_boxes, pred_conf, iou_thr)
+    return cm
+
+
+def print_report(title, cm, names):
+    names = list(names) + ["bg"]
+    width = max(8, max(len(n) for n in names) + 1)
+
+    print(f"\n🔹 {title}")
+    print(f"  {'class':<{width}} {'precision':>9} {'recall':>7} {'support':>8}")
+    for c, name in enumerate(names[:-1]):
+        tp = cm[c, c]
+        pred_total, gt_total = cm[:, c].sum(), cm[c, :].sum()
+        precision = tp / pred_total if pred_total else 0.0
+        recall = tp / gt_total if gt_total else 0.0
+        print(f"  {name:<{width}} {precision:9.3f} {recall:7.3f} {gt_total:8d}")
+
+    print(f"\n  confusion matrix (rows = ground truth, cols = predicted)")
+    print("  " + " " * width + "".join(f"{n[:width - 1]:>{width}}" for n in names))
+    for c, name in enumerate(names):
+        print(f"  {name:<{width}}" + "".join(f"{v:>{width}d}" for v in cm[c]))
+
+
+def main():
+    import pipeline
+
+    parser = argparse.ArgumentParser(description="Evaluate the detection + classification pipeline on a YOLO split")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--datasets", nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    parser.add_argument("--conf", type=float, default=CONF_THRESHOLD, help="YOLO confidence threshold")
+    parser.add_argument("--iou", type=float, default=IOU_THRESHOLD, help="IoU needed to match a label")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="DataLoader workers")
+    parser.add_argument("--throughput", type=int, default=0, metavar="N",
+                        help="time the deployed pipeline on N images of the first dataset")
+    args = parser.parse_args()
+
+    fingerprint = model_fingerprint()
+    policy = crop_routing.load_policy()   # applied at report time, like /predict does
+    models = None   # DamagePipeline, loaded once and only if needed
+    throughput_paths = None
+    for name in args.datasets:
+        root, field = DATASETS[name]
+        image_dir = root / args.split / "images"
+        label_dir = root / args.split / "labels"
+        if not image_dir.exists():
+            print(f"⚠️ Skipping {name} — missing {image_dir}")
+            continue
+
+        image_paths = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+        cache_file = CACHE_DIR / f"{name}_{args.split}.json"
+        cache = load_cache(cache_file, fingerprint)
+
+        if throughput_paths is None:
+            throughput_paths = image_paths[:args.throughput]
+
+        todo = stale_images(image_paths, cache)
+        if todo:
+            if models is None:
+                models = pipeline.DamagePipeline()
+            run_inference(models, todo, cache, cache_file, args.batch_size, args.workers)
+
+        if field == "part":
+            part_names = cache["part_names"] or {}
+            class_names = [part_names.get(str(i), part_names.get(i, str(i))) for i in range(len(part_names))]
+        elif field == "severity":
+            class_names = pipeline.severity_classes
+        else:
+            class_names = pipeline.type_classes
+
+        conf = args.conf
+        if field != "part" and conf < CLASSIFY_CONF:
+            print(f"⚠️ {field} probabilities are cached only for boxes >= {CLASSIFY_CONF}, using conf={CLASSIFY_CONF}")
+            conf = CLASSIFY_CONF
+        cm = evaluate(cache, label_dir, image_paths, field, len(class_names), conf, args.iou,
+                      policy, pipeline.type_classes)
+
+        print(f"\n=== {name.upper()} / {args.split} ({len(image_paths)} images, conf>={conf}, iou>={args.iou}) ===")
+        if not todo:
+            print("  all predictions served from cache")
+        print_report(f"{field} ({name})", cm, class_names)
+
+    if args.throughput and throughput_paths:
+        if models is None:
+            models = pipeline.DamagePipeline()
+        done, elapsed = measure_throughput(models, throughput_paths, args.batch_size, args.workers)
+        if done:
+            print(f"\n⏱️ deployed pipeline throughput: {done / elapsed:.2f} images/s "
+                  f"({done} images in {elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
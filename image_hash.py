@@ -0,0 +1,46 @@
+"""Perceptual hash (pHash) helpers shared by verify_types.py and dedup.py.
+
+A 64-bit DCT hash: grey 32x32 thumbnail -> 2D DCT -> top-left 8x8 low
+frequencies -> 1 bit per coefficient above the median. Near-identical images
+(re-encoded, slightly resized or re-cropped) end up a few bits apart.
+"""
+import cv2
+import numpy as np
+
+HASH_SIZE = 8
+IMG_SIZE = 32
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(IMG_SIZE)
+
+
+def phash_array(img):
+    """pHash of a BGR or grey uint8 array, as a Python int (64 bits)."""
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(img, (IMG_SIZE, IMG_SIZE), interpolation=cv2.INTER_AREA).astype(np.float64)
+    coeffs = (_DCT @ small @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # the DC term only encodes overall brightness; keep it out of the median
+    bits = (coeffs > np.median(coeffs.ravel()[1:])).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def phash_file(path):
+    """pHash of an image file, or None if it cannot be decoded."""
+    # IMREAD_REDUCED_GRAYSCALE_2 decodes JPEGs at half size: the hash only needs 32x32
+    img = cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if img is None or img.size == 0:
+        return None
+    return phash_array(img)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
@@ -0,0 +1,134 @@
+"""Bulk inference workers for the /jobs API.
+
+Run next to the API server:
+
+    python inference_worker.py --workers 2 --batch-size 8
+
+Each worker is a separate process with its own copy of the models. Workers pull
+batches of queued images from the SQLite queue in job_queue.py, so jobs survive
+restarts of both the API and the workers. While /predict traffic is active the
+workers pause between batches so interactive requests keep priority. They get
+their own small thread budget (the cores the tuned API layout leaves free, at
+least 1 thread each, see autotune.apply_bulk_worker_config), so running them does
+not oversubscribe the CPU the API workers already use.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import time
+
+import requests
+from PIL import Image
+
+import job_queue
+
+POLL_INTERVAL = 1.0        # seconds to sleep when the queue is empty
+CALLBACK_RETRIES = 3
+CALLBACK_TIMEOUT = 10
+
+
+def send_callback(conn, job_id):
+    job = conn.execute("SELECT callback_url FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None or not job["callback_url"] or not job_queue.claim_callback(conn, job_id):
+        return
+
+    payload = job_queue.get_job(conn, job_id)
+    for attempt in range(CALLBACK_RETRIES):
+        try:
+            res = requests.post(job["callback_url"], json=payload, timeout=CALLBACK_TIMEOUT)
+            if res.status_code < 400:
+                job_queue.set_callback_status(conn, job_id, "sent")
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(2 ** attempt)
+
+    print(f"⚠️ Callback failed for job {job_id}")
+    job_queue.set_callback_status(conn, job_id, "failed")
+
+
+def process_batch(pipeline, rows):
+    imgs, ok_rows, outcomes = [], [], []
+    for row in rows:
+        try:
+            imgs.append(Image.open(row["path"]).convert("RGB"))
+            ok_rows.append(row)
+        except Exception as e:
+            outcomes.append((row["id"], None, f"could not read image: {e}"))
+
+    try:
+        predictions = pipeline.predict_images(imgs)
+        outcomes.extend((row["id"], pred, None) for row, pred in zip(ok_rows, predictions))
+    except Exception as e:
+        # don't fail the whole batch because of one image: retry them one at a time
+        print(f"⚠️ Batch failed ({e}), retrying images individually")
+        for row, img in zip(ok_rows, imgs):
+            try:
+                outcomes.append((row["id"], pipeline.predict(img), None))
+            except Exception as e:
+                outcomes.append((row["id"], None, str(e)))
+    return outcomes
+
+
+def worker_loop(worker_index, batch_size, niceness, n_workers, threads):
+    from autotune import apply_bulk_worker_config
+    from pipeline import DamagePipeline
+
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)   # bulk work yields the CPU to the API process
+
+    # only the cores the tuned API layout leaves free, split between the bulk workers
+    config = apply_bulk_worker_config(n_workers, threads)
+    conn = job_queue.connect()
+    pipeline = DamagePipeline(batch_size=config.get("classifier_batch_size"))
+    print(f"🚀 worker {worker_index} (pid {os.getpid()}) ready, {config['intra_op_threads']} threads")
+
+    while True:
+        if job_queue.interactive_busy():
+            time.sleep(0.2)
+            continue
+
+        for job_id in job_queue.pending_callbacks(conn):
+            send_callback(conn, job_id)
+
+        rows = job_queue.claim_batch(conn, batch_size)
+        if not rows:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        start = time.time()
+        outcomes = process_batch(pipeline, rows)
+        completed = job_queue.finish_items(conn, outcomes)
+        print(f"worker {worker_index}: {len(rows)} images in {time.time() - start:.2f}s")
+
+        for job_id in completed:
+            send_callback(conn, job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run bulk inference workers for the /jobs API")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=8, help="images claimed per batch")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads per worker (default: cores left free by the tuned API workers, min 1)")
+    parser.add_argument("--nice", type=int, default=10, help="CPU niceness added to workers (0 to disable)")
+    args = parser.parse_args()
+
+    job_queue.connect().close()   # create the schema once before forking
+
+    procs = []
+    for i in range(args.workers):
+        p = mp.Process(target=worker_loop, args=(i, args.batch_size, args.nice, args.workers, args.threads),
+                       daemon=True)
+        p.start()
+        procs.append(p)
+
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        print("\nStopping workers (unfinished items are re-queued when their lease expires)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+# ---------------------------------------
+# CONFIG
+JOBS_DIR = Path("jobs")                 # uploaded job images live here
+DB_PATH = JOBS_DIR / "queue.sqlite3"    # persistent queue (survives restarts)
+
+LEASE_SECONDS = 300       # a claimed item is handed out again if not finished by then
+MAX_ATTEMPTS = 3          # items failing this many times are marked failed
+CALLBACK_LEASE_SECONDS = 120   # a callback stuck in 'sending' (dead worker) is claimed again after this
+
+# /predict touches this file; bulk workers back off while it is fresh
+INTERACTIVE_MARKER = JOBS_DIR / "interactive.marker"
+INTERACTIVE_GRACE = 2.0   # seconds
+# ---------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              TEXT PRIMARY KEY,
+    status          TEXT NOT NULL,          -- queued | running | done
+    created         REAL NOT NULL,
+    updated         REAL NOT NULL,
+    total           INTEGER NOT NULL,
+    callback_url    TEXT,
+    callback_status TEXT,                   -- NULL | sending | sent | failed
+    callback_claimed REAL                   -- when callback_status became 'sending'
+);
+CREATE TABLE IF NOT EXISTS items (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id      TEXT NOT NULL REFERENCES jobs(id),
+    idx         INTEGER NOT NULL,
+    filename    TEXT NOT NULL,
+    path        TEXT NOT NULL,
+    status      TEXT NOT NULL,              -- queued | running | done | failed
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    result      TEXT,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS items_status ON items(status, id);
+CREATE INDEX IF NOT EXISTS items_job ON items(job_id, idx);
+"""
+
+
+def connect(db_path=DB_PATH):
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # queues created before callback_claimed existed
+    columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+    if "callback_claimed" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN callback_claimed REAL")
+    return conn
+
+
+# ---------------------------------------
+# API SIDE
+# ---------------------------------------
+def submit_job(conn, files, callback_url=None, jobs_dir=JOBS_DIR):
+    """Store uploaded images on disk and enqueue one item per image.
+
+    `files` is a list of (filename, raw_bytes). Returns the new job id.
+    """
+    job_id = uuid.uuid4().hex
+    job_dir = Path(jobs_dir) / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    for idx, (filename, raw) in enumerate(files):
+        suffix = Path(filename or "").suffix.lower() or ".jpg"
+        path = job_dir / f"{idx:05d}{suffix}"
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        rows.append((job_id, idx, filename or path.name, str(path), "queued"))
+
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, status, created, updated, total, callback_url) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, "queued", now, now, len(rows), callback_url),
+        )
+        conn.executemany(
+            "INSERT INTO items (job_id, idx, filename, path, status) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return job_id
+
+
+def get_job(conn, job_id):
+    """Job status plus per-image results (partial while the job is running)."""
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None:
+        return None
+
+    items = conn.execute(
+        "SELECT idx, filename, status, result, error FROM items WHERE job_id = ? ORDER BY idx",
+        (job_id,),
+    ).fetchall()
+
+    counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+    results = []
+    for it in items:
+        counts[it["status"]] += 1
+        entry = {"index": it["idx"], "filename": it["filename"], "status": it["status"]}
+        if it["result"] is not None:
+            entry["predictions"] = json.loads(it["result"])
+        if it["error"]:
+            entry["error"] = it["error"]
+        results.append(entry)
+
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+        "counts": counts,
+        "callback_status": job["callback_status"],
+        "results": results,
+    }
+
+
+def touch_interactive(marker=INTERACTIVE_MARKER):
+    """Record that an interactive request is in flight (cheap: one utime call)."""
+    try:
+        os.utime(marker, None)
+    except FileNotFoundError:
+        Path(marker).parent.mkdir(parents=True, exist_ok=True)
+        Path(marker).touch()
+
+
+def interactive_busy(marker=INTERACTIVE_MARKER, grace=INTERACTIVE_GRACE):
+    try:
+        return time.time() - os.stat(marker).st_mtime < grace
+    except FileNotFoundError:
+        return False
+
+
+# ---------------------------------------
+# WORKER SIDE
+# ---------------------------------------
+def claim_batch(conn, batch_size, lease_seconds=LEASE_SECONDS):
+    """Atomically lease up to batch_size queued items, or a single expired one. Returns sqlite rows."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # give up on items that keep crashing the worker
+        conn.execute(
+            "UPDATE items SET status = 'failed', error = 'too many attempts' "
+            "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+            (now, MAX_ATTEMPTS),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'done', updated = ? WHERE status != 'done' AND NOT EXISTS ("
+            "SELECT 1 FROM items WHERE items.job_id = jobs.id AND items.status IN ('queued', 'running'))",
+            (now,),
+        )
+        # an expired lease means the worker holding it died, possibly because of one of
+        # its images: retry those items one at a time so only the bad image uses up attempts
+        rows = conn.execute(
+            "SELECT id, job_id, idx, path FROM items "
+            "WHERE status = 'running' AND lease_until < ? ORDER BY id LIMIT 1",
+            (now,),
+        ).fetchall()
+        if not rows:
+            rows = conn.execute(
+                "SELECT id, job_id, idx, path FROM items WHERE status = 'queued' ORDER BY id LIMIT ?",
+                (batch_size,),
+            ).fetchall()
+        if rows:
+            ids = [r["id"] for r in rows]
+            marks = ",".join("?" * len(ids))
+            conn.execute(
+                f"UPDATE items SET status = 'running', lease_until = ?, attempts = attempts + 1 "
+                f"WHERE id IN ({marks})",
+                [now + lease_seconds, *ids],
+            )
+            job_ids = sorted({r["job_id"] for r in rows})
+            conn.execute(
+                f"UPDATE jobs SET status = 'running', updated = ? "
+                f"WHERE status = 'queued' AND id IN ({','.join('?' * len(job_ids))})",
+                [now, *job_ids],
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def finish_items(conn, outcomes):
+    """Store results for a claimed batch.
+
+    `outcomes` is a list of (item_id, predictions_or_None, error_or_None).
+    Returns the ids of jobs that became complete with this batch.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        job_ids = set()
+        for item_id, predictions, error in outcomes:
+            if error is None:
+                conn.execute(
+                    "UPDATE items SET status = 'done', result = ?, error = NULL, lease_until = NULL WHERE id = ?",
+                    (json.dumps(predictions), item_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE items SET status = 'failed', error = ?, lease_until = NULL WHERE id = ?",
+                    (error, item_id),
+                )
+            row = conn.execute("SELECT job_id FROM items WHERE id = ?", (item_id,)).fetchone()
+            job_ids.add(row["job_id"])
+
+        completed = []
+        for job_id in sorted(job_ids):
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM items WHERE job_id = ? AND status IN ('queued', 'running')",
+                (job_id,),
+            ).fetchone()[0]
+            if pending == 0:
+                conn.execute("UPDATE jobs SET status = 'done', updated = ? WHERE id = ?", (now, job_id))
+                completed.append(job_id)
+            else:
+                conn.execute("UPDATE jobs SET updated = ? WHERE id = ?", (now, job_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return completed
+
+
+# not delivered yet, or stuck in 'sending' past the lease (parameter: now - CALLBACK_LEASE_SECONDS)
+_CALLBACK_CLAIMABLE = (
+    "(callback_status IS NULL OR "
+    "(callback_status = 'sending' AND (callback_claimed IS NULL OR callback_claimed < ?)))"
+)
+
+
+def pending_callbacks(conn):
+    """Finished jobs with a callback that has not been delivered yet (e.g. after a restart).
+
+    Includes callbacks left in 'sending' for longer than CALLBACK_LEASE_SECONDS,
+    i.e. the worker delivering them died.
+    """
+    return [r["id"] for r in conn.execute(
+        "SELECT id FROM jobs WHERE status = 'done' AND callback_url IS NOT NULL AND " + _CALLBACK_CLAIMABLE,
+        (time.time() - CALLBACK_LEASE_SECONDS,),
+    ).fetchall()]
+
+
+def claim_callback(conn, job_id):
+    """Mark a callback as being delivered so only one worker sends it."""
+    now = time.time()
+    cur = conn.execute(
+        "UPDATE jobs SET callback_status = 'sending', callback_claimed = ? WHERE id = ? AND " + _CALLBACK_CLAIMABLE,
+        (now, job_id, now - CALLBACK_LEASE_SECONDS),
+    )
+    return cur.rowcount == 1
+
+
+def set_callback_status(conn, job_id, status):
+    conn.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (status, job_id))
@@ -0,0 +1,238 @@
+"""Pack class-folder crop datasets into memory-mapped shards.
+
+    python pack_shards.py                                   # types_classification -> types_shards
+    python pack_shards.py --src D:/COCO_dataset/severity_classification --dst D:/COCO_dataset/severity_shards
+
+Turns the <split>/<class>/*.jpg folders written by convert_to_classify_severity.py
+into a few large files per split:
+
+    <dst>/<split>/index.json           class names, crop size, shard list
+    <dst>/<split>/images_00000.npy     uint8 [N, H, W, 3] RGB crops, pre-resized
+    <dst>/<split>/labels_00000.npy     int64 [N]
+
+ShardDataset streams them back with np.load(mmap_mode="r"): no per-crop open()
+or JPEG decode, and each sample is a view into the page cache.
+"""
+import argparse
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from convert_to_classify_severity import CLASS_MAP
+
+# ---------------------------------------
+# CONFIG
+SRC_DIR = Path(r"D:\COCO_dataset\types_classification")
+DST_DIR = Path(r"D:\COCO_dataset\types_shards")
+SPLITS = ["train", "test", "val"]
+
+CROP_SIZE = 224           # crops are stored as CROP_SIZE x CROP_SIZE
+SHARD_SIZE = 2048         # crops per shard (~300 MB at 224px)
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+# ---------------------------------------
+
+
+def class_order(split_dir):
+    """CLASS_MAP order first (matches pipeline.type_classes), then any other folders sorted."""
+    folders = {p.name for p in split_dir.iterdir() if p.is_dir()}
+    known = [c for c in CLASS_MAP.values() if c in folders]
+    return known + sorted(folders - set(known))
+
+
+def load_crop(path, size):
+    img = cv2.imread(str(path))
+    if img is None:
+        return None
+    img = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def _load_crop_args(args):
+    return load_crop(*args)
+
+
+def pack_split(src, dst, size, shard_size, pool, seed=0):
+    classes = class_order(src)
+    samples = []
+    for label, cls in enumerate(classes):
+        samples += [(p, label) for p in sorted((src / cls).iterdir()) if p.suffix.lower() in IMAGE_EXTS]
+
+    # mix classes across shards so a small shuffle buffer is enough at training time
+    random.Random(seed).shuffle(samples)
+
+    dst.mkdir(parents=True, exist_ok=True)
+    shards, skipped = [], 0
+    for n, start in enumerate(range(0, len(samples), shard_size)):
+        chunk = samples[start:start + shard_size]
+        images_name, labels_name = f"images_{n:05d}.npy", f"labels_{n:05d}.npy"
+
+        tmp_images = dst / (images_name + ".tmp")
+        out = np.lib.format.open_memmap(tmp_images, mode="w+", dtype=np.uint8, shape=(len(chunk), size, size, 3))
+        labels = np.empty(len(chunk), dtype=np.int64)
+
+        count = 0
+        results = pool.map(_load_crop_args, [(p, size) for p, _ in chunk], chunksize=32)
+        for (path, label), img in zip(chunk, results):
+            if img is None:
+                print(f"⚠️ skip bad: {path}")
+                skipped += 1
+                continue
+            out[count] = img
+            labels[count] = label
+            count += 1
+        out.flush()
+        del out
+
+        if count < len(chunk):
+            # drop the slots of unreadable images
+            full = np.load(tmp_images, mmap_mode="r")
+            np.save(dst / images_name, full[:count])
+            del full
+            os.remove(tmp_images)
+        else:
+            os.replace(tmp_images, dst / images_name)
+        np.save(dst / labels_name, labels[:count])
+
+        shards.append({"images": images_name, "labels": labels_name, "count": count})
+        print(f"  shard {n}: {count} crops")
+
+    index = {
+        "classes": classes,
+        "size": [size, size],
+        "total": sum(s["count"] for s in shards),
+        "shards": shards,
+    }
+    tmp = dst / "index.json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, dst / "index.json")
+    return index, skipped
+
+
+# ---------------------------------------
+# DATASET
+# ---------------------------------------
+class ShardDataset(IterableDataset):
+    """Streams (uint8 HWC crop, label) pairs from a packed split.
+
+    Shards are split across DataLoader workers and read block by block in random
+    order, then mixed through a shuffle buffer. Samples are read-only views into
+    the memory-mapped shard; use collate_uint8 to stack them into one uint8 NCHW
+    tensor per batch (the only copy), and normalize on the batch.
+    """
+
+    def __init__(self, root, split, shuffle=True, shuffle_buffer=4096, block_size=256, transform=None, seed=0):
+        self.root = Path(root) / split
+        with open(self.root / "index.json", "r") as f:
+            self.index = json.load(f)
+        self.classes = self.index["classes"]
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.block_size = block_size
+        self.transform = transform
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return self.index["total"]
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def labels(self):
+        """All labels in storage order (small; used e.g. for class weights)."""
+        return np.concatenate([np.load(self.root / s["labels"]) for s in self.index["shards"]])
+
+    def _samples(self, rng, shard_ids):
+        for sid in shard_ids:
+            shard = self.index["shards"][sid]
+            images = np.load(self.root / shard["images"], mmap_mode="r")
+            labels = np.load(self.root / shard["labels"])
+            blocks = list(range(0, len(labels), self.block_size))
+            if self.shuffle:
+                rng.shuffle(blocks)
+            for b in blocks:
+                for i in range(b, min(b + self.block_size, len(labels))):
+                    yield images[i], int(labels[i])
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker_id, num_workers = (info.id, info.num_workers) if info else (0, 1)
+
+        rng = random.Random(self.seed + self.epoch)
+        shard_ids = list(range(len(self.index["shards"])))
+        if self.shuffle:
+            rng.shuffle(shard_ids)
+        shard_ids = shard_ids[worker_id::num_workers]
+        rng = random.Random(self.seed + self.epoch * 1000 + worker_id)
+
+        samples = self._samples(rng, shard_ids)
+        if not self.shuffle:
+            for img, label in samples:
+                yield self._apply(img, label)
+            return
+
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            j = rng.randrange(len(buffer))
+            buffer[j], sample = sample, buffer[j]
+            yield self._apply(*sample)
+        rng.shuffle(buffer)
+        for sample in buffer:
+            yield self._apply(*sample)
+
+    def _apply(self, img, label):
+        if self.transform is not None:
+            img = self.transform(img)
+        return img, label
+
+
+def collate_uint8(batch):
+    """Stack HWC uint8 crops into one uint8 NCHW tensor plus a label tensor."""
+    images = torch.from_numpy(np.stack([b[0] for b in batch])).permute(0, 3, 1, 2)
+    labels = torch.tensor([b[1] for b in batch], dtype=torch.long)
+    return images, labels
+
+
+def normalize_batch(images, mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)):
+    """uint8 NCHW -> float NCHW with the same normalization as pipeline.tfm."""
+    mean = torch.tensor(mean, device=images.device).view(1, 3, 1, 1)
+    std = torch.tensor(std, device=images.device).view(1, 3, 1, 1)
+    return (images.float() / 255.0 - mean) / std
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack class-folder crops into memory-mapped shards")
+    parser.add_argument("--src", default=str(SRC_DIR))
+    parser.add_argument("--dst", default=str(DST_DIR))
+    parser.add_argument("--size", type=int, default=CROP_SIZE)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    src, dst = Path(args.src), Path(args.dst)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for split in SPLITS:
+            if not (src / split).exists():
+                print(f"⚠️ Skipping {split} — missing folder.")
+                continue
+            print(f"\n📦 Packing {split}")
+            index, skipped = pack_split(src / split, dst / split, args.size, args.shard_size, pool)
+            print(f"✅ {split}: {index['total']} crops in {len(index['shards'])} shards "
+                  f"({skipped} unreadable skipped), classes: {index['classes']}")
+
+    print("\n🎯 Packing complete:", dst)
+
+
+if __name__ == "__main__":
+    main()
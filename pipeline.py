@@ -0,0 +1,210 @@
+import threading
+
+import torch
+import timm
+import torchvision.transforms as T
+
+import crop_routing
+
+# ---------------------------------------
+# CONFIG
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+severity_model_path = "convnextb_finetuned.pth"
+type_model_path     = "mobilenetv3_large_100_type_best.pth"
+yolo_model_path     = "runs/detect/train/weights/best.pt"
+
+severity_arch = "convnext_base"
+type_arch     = "mobilenetv3_large_100"
+
+severity_classes = ["mild", "moderate", "severe"]
+type_classes     = ["Dent","Scratch","Crack","glass shatter","lamp broken","tire flat"]
+
+# how many crops go through a classifier in one forward
+classifier_batch_size = 32
+# ---------------------------------------
+
+# transforms (use same norm for both classifiers)
+tfm = T.Compose([
+    T.Resize((224,224)),
+    T.ToTensor(),
+    T.Normalize([0.485,0.456,0.406],[0.229,0.224,0.225]),
+])
+
+
+def load_classifier(arch, num_classes, weights_path):
+    model = timm.create_model(arch, pretrained=False, num_classes=num_classes)
+    model.load_state_dict(torch.load(weights_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return model
+
+
+class DamagePipeline:
+    """YOLO part detection followed by severity and type classification of the boxes.
+
+    Which boxes reach which classifier is decided by the routing policy in
+    crop_routing.yaml (confidence/area gates, overlap merging, per-part rules).
+
+    Shared by the /predict endpoint, the bulk job workers and the offline tools so
+    that all of them run exactly the same models and post-processing.
+    """
+
+    def __init__(self, batch_size=None, max_concurrent=None, routing_policy=None):
+        from ultralytics import YOLO
+
+        self.yolo_model = YOLO(yolo_model_path).to(device)
+        self.yolo_model.eval()
+        self.severity_model = load_classifier(severity_arch, len(severity_classes), severity_model_path)
+        self.type_model = load_classifier(type_arch, len(type_classes), type_model_path)
+        self.batch_size = batch_size or classifier_batch_size
+        # caps concurrent forwards when called from a thread pool (see autotune.py)
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.policy = routing_policy or crop_routing.load_policy()
+
+    def _run(self, model, crops, n_classes):
+        out = []
+        with torch.no_grad():
+            for i in range(0, len(crops), self.batch_size):
+                batch = torch.stack([tfm(c) for c in crops[i:i + self.batch_size]]).to(device)
+                out.append(model(batch).float().cpu())
+        if not out:
+            return torch.empty(0, n_classes)
+        return torch.cat(out)
+
+    def classify(self, crops):
+        """Run both classifiers over a list of PIL crops, batch_size crops at a time.
+
+        Returns (severity_logits, type_logits) as CPU tensors with one row per crop.
+        """
+        return (self._run(self.severity_model, crops, len(severity_classes)),
+                self._run(self.type_model, crops, len(type_classes)))
+
+    def detect(self, imgs, conf=None):
+        """YOLO only: one dict per image with pixel boxes, part ids and confidences."""
+        kwargs = {"verbose": False}
+        if conf is not None:
+            kwargs["conf"] = conf
+        results = self.yolo_model(imgs, **kwargs)
+
+        detections = []
+        for res in results:
+            det = {"boxes": [], "parts": [], "confs": []}
+            for box in res.boxes:
+                det["boxes"].append(list(map(int, box.xyxy[0])))
+                det["parts"].append(int(box.cls))
+                det["confs"].append(float(box.conf))
+            detections.append(det)
+        return detections
+
+    def predict_images_with_meta(self, imgs):
+        """Like predict_images, plus one routing summary dict per image."""
+        if not imgs:
+            return [], []
+        if self._slots is None:
+            return self._predict_images(imgs)
+        with self._slots:
+            return self._predict_images(imgs)
+
+    def predict_images(self, imgs):
+        """Predict a list of RGB PIL images; returns one list of box dicts per image.
+
+        Boxes whose classifiers were skipped by the routing policy have
+        severity / damage_type set to None.
+        """
+        return self.predict_images_with_meta(imgs)[0]
+
+    def detect_and_classify(self, imgs, conf=None, classify_conf=None, max_boxes=None):
+        """Raw, unrouted pipeline output for a list of RGB PIL images.
+
+        Returns one dict per image with integer pixel boxes [x1,y1,x2,y2], YOLO part
+        ids and confidences, and softmax probabilities from both classifiers.
+        `conf` overrides the YOLO confidence threshold (the evaluation harness
+        passes a very low one and applies its own threshold and the routing policy
+        afterwards, see evaluate_pipeline.routed_predictions). Only boxes
+        with confidence >= classify_conf, at most max_boxes per image (highest
+        confidence first), are classified; the others get None probabilities.
+        """
+        raw = self.detect(imgs, conf)
+
+        # collect crops from every image so the classifiers see full batches
+        crops, owners = [], []
+        for n, (img, r) in enumerate(zip(imgs, raw)):
+            order = sorted(range(len(r["boxes"])), key=lambda k: -r["confs"][k])
+            if classify_conf is not None:
+                order = [k for k in order if r["confs"][k] >= classify_conf]
+            for k in order[:max_boxes]:
+                crops.append(img.crop(tuple(r["boxes"][k])))
+                owners.append((n, k))
+
+        sev_logits, type_logits = self.classify(crops)
+        sev_probs = sev_logits.softmax(dim=1).tolist()
+        type_probs = type_logits.softmax(dim=1).tolist()
+
+        for r in raw:
+            r["severity_probs"] = [None] * len(r["boxes"])
+            r["type_probs"] = [None] * len(r["boxes"])
+        for i, (n, k) in enumerate(owners):
+            raw[n]["severity_probs"][k] = sev_probs[i]
+            raw[n]["type_probs"][k] = type_probs[i]
+        return raw
+
+    def _predict_images(self, imgs):
+        detections = self.detect(imgs)
+
+        # route every box, then batch the crops of each classifier across all images
+        plans, metas = [], []
+        sev_crops, sev_refs, type_crops, type_refs = [], [], [], []
+        for n, (img, det) in enumerate(zip(imgs, detections)):
+            plan, stats = crop_routing.plan_image(det["boxes"], det["parts"], det["confs"],
+                                                  self.yolo_model.names, img.size, self.policy, type_classes)
+            for k, p in enumerate(plan):
+                if p["severity"] or p["type"]:
+                    crop = img.crop(tuple(det["boxes"][p["index"]]))
+                    if p["severity"]:
+                        sev_crops.append(crop)
+                        sev_refs.append((n, k))
+                    if p["type"]:
+                        type_crops.append(crop)
+                        type_refs.append((n, k))
+            plans.append(plan)
+            metas.append({
+                "boxes_detected": len(det["boxes"]),
+                "boxes_returned": len(plan),
+                "skipped": dict(stats),
+                "classifier_calls": {"severity": 0, "type": 0},
+            })
+
+        sev_logits = self._run(self.severity_model, sev_crops, len(severity_classes))
+        type_logits = self._run(self.type_model, type_crops, len(type_classes))
+
+        severity = {}
+        for (n, k), row in zip(sev_refs, sev_logits):
+            severity[n, k] = severity_classes[int(row.argmax())]
+            metas[n]["classifier_calls"]["severity"] += 1
+        damage_type = {}
+        for (n, k), row in zip(type_refs, type_logits):
+            damage_type[n, k] = type_classes[crop_routing.best_allowed_type(row, plans[n][k]["allowed_types"])]
+            metas[n]["classifier_calls"]["type"] += 1
+
+        outputs = []
+        for n, (det, plan) in enumerate(zip(detections, plans)):
+            output = []
+            for k, p in enumerate(plan):
+                x1, y1, x2, y2 = det["boxes"][p["index"]]
+                fixed = p["fixed_type"]
+                output.append({
+                    "part": p["part"],
+                    "severity": severity.get((n, k)),
+                    "damage_type": damage_type.get((n, k), type_classes[fixed] if fixed is not None else None),
+                    "x1": x1, "y1": y1, "x2": x2, "y2": y2
+                })
+            outputs.append(output)
+        return outputs, metas
+
+    def predict(self, img):
+        return self.predict_images([img])[0]
+
+    def predict_with_meta(self, img):
+        outputs, metas = self.predict_images_with_meta([img])
+        return outputs[0], metas[0]
@@ -1,49 +1,217 @@
+import argparse
+import difflib
+import json
 import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
 
 # Base dataset path
 base_dir = r"D:/COCO_dataset/dataset_parts"
 
-def clean_labels(split):
-    labels_dir = os.path.join(base_dir, split, "labels")
+# Class names the labels must match: parts_data.yaml describes dataset_parts,
+# obj_detection.yaml (8 classes, different ids) describes the damage-part dataset
+data_yaml = "parts_data.yaml"
+
+splits = ["train", "val", "test"]
+
+# Boxes narrower/shorter than this (normalized) are dropped
+MIN_BOX_SIZE = 1e-3
+
+# Labels rounded to 6 decimals put edge-touching boxes a few 1e-7 outside the image;
+# only boxes further out than this count as out of range
+EDGE_EPS = 1e-6
+
+# Issues that are only reported unless --fix is given
+REPORT_ONLY = ["unknown_class", "wrong_field_count", "malformed", "out_of_range"]
+
+# Files verified clean are remembered by (mtime, size) and not reopened next time
+CLEAN_CACHE_NAME = ".relabel_clean.json"
+
+
+def load_class_ids(yaml_path):
+    """Valid class ids from a YOLO data yaml (`names` as a list or an {id: name} dict)."""
+    with open(yaml_path, "r") as f:
+        data = yaml.safe_load(f)
+    names = data["names"]
+    if isinstance(names, dict):
+        return sorted(int(k) for k in names)
+    return list(range(len(names)))
+
+
+def normalize_labels(text, valid_ids, fix=False):
+    """Return (cleaned_text, Counter of issues, kept) for the content of one label file.
+
+    Always fixed:
+    - float-like class ids ("6.0") become ints
+    - boxes narrower/shorter than MIN_BOX_SIZE are dropped
+    - exact duplicate boxes are dropped
+    Only reported (and kept as they are) unless fix=True, which drops or clips them:
+    - lines with unknown class ids, the wrong number of fields or unparsable values
+    - boxes reaching outside the image (clipped with fix=True)
+    `kept` counts the reported lines that were left in the file.
+    Coordinates that need no clipping keep their original text.
+    """
+    issues, kept = Counter(), 0
+    new_lines, seen = [], set()
+
+    for line in text.splitlines():
+        parts = line.strip().split()
+        if not parts:
+            continue
+        if len(parts) != 5:
+            issue = "wrong_field_count"
+        else:
+            try:
+                cls_id = int(float(parts[0]))
+                xc, yc, w, h = map(float, parts[1:])
+                issue = None if cls_id in valid_ids else "unknown_class"
+            except ValueError:
+                issue = "malformed"
+        if issue:
+            issues[issue] += 1
+            if not fix:
+                new_lines.append(line.strip())
+                kept += 1
+            continue
+        if parts[0] != str(cls_id):
+            issues["float_class_id"] += 1
+
+        coords = parts[1:]
+        x1, y1, x2, y2 = xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2
+        if min(x1, y1) < -EDGE_EPS or max(x2, y2) > 1 + EDGE_EPS:
+            issues["out_of_range"] += 1
+            if fix:
+                x1, y1 = max(x1, 0.0), max(y1, 0.0)
+                x2, y2 = min(x2, 1.0), min(y2, 1.0)
+                xc, yc, w, h = (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1
+                coords = [f"{v:.6f}" for v in (xc, yc, w, h)]
+            else:
+                kept += 1
+
+        if w < MIN_BOX_SIZE or h < MIN_BOX_SIZE:
+            issues["degenerate"] += 1
+            continue
+
+        key = (cls_id, round(xc, 6), round(yc, 6), round(w, 6), round(h, 6))
+        if key in seen:
+            issues["duplicate"] += 1
+            continue
+        seen.add(key)
+
+        new_lines.append(" ".join([str(cls_id)] + coords))
+
+    return "\n".join(new_lines) + ("\n" if new_lines else ""), issues, kept
+
+
+def write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _clean_files(args):
+    """Worker: lint and (unless dry_run) rewrite a chunk of label files."""
+    paths, valid_ids, dry_run, fix = args
+    results = []
+    for path in paths:
+        with open(path, "r") as f:
+            old = f.read()
+        new, issues, kept = normalize_labels(old, set(valid_ids), fix)
+        diff = None
+        if new != old:
+            if dry_run:
+                diff = "".join(difflib.unified_diff(
+                    old.splitlines(True), new.splitlines(True), fromfile=path, tofile=path + " (cleaned)"))
+            else:
+                write_atomic(path, new)
+        st = os.stat(path)
+        results.append((path, new != old, issues, kept, diff, [st.st_mtime_ns, st.st_size]))
+    return results
+
+
+def clean_labels(split, pool, valid_ids, dry_run, root=base_dir, fix=False):
+    labels_dir = os.path.join(root, split, "labels")
 
     if not os.path.exists(labels_dir):
         print(f"⚠️ No labels folder found in {split}")
-        return
+        return Counter()
 
-    label_files = [f for f in os.listdir(labels_dir) if f.endswith(".txt")]
-    print(f"\n🧹 Cleaning {split}: {len(label_files)} label files")
+    cache_path = os.path.join(labels_dir, CLEAN_CACHE_NAME)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+    if cache.get("valid_ids") != valid_ids or cache.get("min_box_size") != MIN_BOX_SIZE:
+        cache = {"valid_ids": valid_ids, "min_box_size": MIN_BOX_SIZE, "files": {}}
+    known_clean = cache["files"]
 
-    fixed_count = 0
-    malformed_count = 0
+    todo, total = [], 0
+    with os.scandir(labels_dir) as it:
+        for e in it:
+            if not e.name.endswith(".txt"):
+                continue
+            total += 1
+            st = e.stat()
+            if known_clean.get(e.name) != [st.st_mtime_ns, st.st_size]:
+                todo.append(e.path)
 
-    for file in label_files:
-        path = os.path.join(labels_dir, file)
-        new_lines = []
+    print(f"\n🧹 Cleaning {split}: {total} label files ({len(todo)} new or modified)")
+
+    issues, changed = Counter(), 0
+    chunks = [todo[i:i + 256] for i in range(0, len(todo), 256)]
+    for results in pool.map(_clean_files, [(c, valid_ids, dry_run, fix) for c in chunks]):
+        for path, was_changed, file_issues, kept, diff, key in results:
+            issues.update(file_issues)
+            if was_changed:
+                changed += 1
+                if diff:
+                    print(diff, end="")
+            # files with reported-but-kept lines are re-checked (and re-reported) every run
+            if not kept and (not dry_run or not was_changed):
+                known_clean[os.path.basename(path)] = key
+
+    if not dry_run:
+        write_atomic(cache_path, json.dumps(cache))
+
+    verb = "would change" if dry_run else "rewritten"
+    detail = ", ".join(f"{k}={v}" for k, v in sorted(issues.items())) or "no issues"
+    print(f"✅ {split}: {changed} files {verb} ({detail})")
+    return issues
 
-        with open(path, "r") as f:
-            for line in f:
-                parts = line.strip().split()
-                if not parts:
-                    continue
-                try:
-                    # Convert float-like class ID (e.g., "6.0") → int
-                    parts[0] = str(int(float(parts[0])))
-                    new_lines.append(" ".join(parts))
-                except ValueError:
-                    malformed_count += 1
-                    print(f"⚠️ Skipping malformed line in {file}: {line.strip()}")
 
-        # Write cleaned data back
-        with open(path, "w") as f:
-            f.write("\n".join(new_lines) + ("\n" if new_lines else ""))
+def main():
+    parser = argparse.ArgumentParser(description="Normalize and lint YOLO label files")
+    parser.add_argument("--base-dir", default=base_dir)
+    parser.add_argument("--data", default=data_yaml, help="YOLO data yaml with the class names")
+    parser.add_argument("--dry-run", action="store_true", help="print a diff instead of writing files")
+    parser.add_argument("--fix", action="store_true",
+                        help="also drop unknown-class / wrong-field-count lines and clip out-of-range boxes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
 
-        fixed_count += 1
+    valid_ids = load_class_ids(args.data)
 
-    print(f"✅ {split} cleaned: {fixed_count} files processed, {malformed_count} malformed lines skipped.")
+    total = Counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for split in splits:
+            total.update(clean_labels(split, pool, valid_ids, args.dry_run, args.base_dir, args.fix))
 
+    if total:
+        print("\nIssues found:", ", ".join(f"{k}={v}" for k, v in sorted(total.items())))
+    reported = [k for k in REPORT_ONLY if total[k]]
+    if reported and not args.fix:
+        print(f"⚠️ {', '.join(reported)} lines were kept as they are. Check that --data ({args.data}) "
+              f"matches this dataset, then rerun with --fix to drop or clip them.")
+    if args.dry_run:
+        print("\nDry run complete — no files written.")
+    else:
+        print("\n🎯 Label cleanup complete!")
 
-# Clean all three splits
-for split in ["train", "val", "test"]:
-    clean_labels(split)
 
-print("\n🎯 Label cleanup complete! All class IDs are now integers.")
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,217 @@
+import argparse
+import json
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from convert_to_classify_severity import CLASS_MAP, MANIFEST_NAME, read_label_lines
+
 # ORIGINAL YOLO dataset
 YOLO_DIR  = Path(r"D:\COCO_dataset\dataset_types")
 
 # CLASSIFICATION dataset created by crop script
 CLASS_DIR = Path(r"D:\COCO_dataset\types_classification")
 
-CLASS_MAP = {
-    "0": "Dent",
-    "1": "Scratch",
-    "2": "Crack",
-    "3": "glass shatter",
-    "4": "lamp broken",
-    "5": "tire flat",
-}
-
 # reverse mapping (folder name → class_id)
 REV_MAP = {v: k for k,v in CLASS_MAP.items()}
 
 splits = ["train", "test", "val"]
 
-errors = []
-
-for split in splits:
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+
+# --phash: a crop further than this many bits from its re-derived crop is stale/misaligned
+PHASH_MAX_DISTANCE = 10
+
+REPORT_PATH = Path("verify_types_report.json")
+
+
+# ---------------------------------------
+# INDEX: every label file parsed exactly once
+# ---------------------------------------
+def _parse_labels(label_files):
+    index = {}
+    for label_file in label_files:
+        index[Path(label_file).stem] = [
+            (line.split() or [None])[0] for line in read_label_lines(label_file)
+        ]
+    return index
+
+
+def build_label_index(label_dir, pool):
+    """stem -> list of class ids per label line (same line numbering as the crop script)."""
+    files = [str(p) for p in label_dir.glob("*.txt")]
+    chunks = [files[i:i + 512] for i in range(0, len(files), 512)]
+    index = {}
+    for part in pool.map(_parse_labels, chunks):
+        index.update(part)
+    return index
+
+
+def find_source_images(image_dir):
+    sources = {}
+    if image_dir.exists():
+        for p in image_dir.iterdir():
+            if p.suffix.lower() in IMAGE_EXTS:
+                sources[p.stem] = str(p)
+    return sources
+
+
+# ---------------------------------------
+# CHECKS
+# ---------------------------------------
+def check_crop(split, img_file, folder, label_index):
+    """Label-only checks; returns (error_dict_or_None, (orig_stem, idx) or None)."""
+    expected_cls_id = REV_MAP[folder]
+    name = Path(img_file).stem          # e.g. 000123_1 (stems may contain '_' themselves)
+    if "_" not in name:
+        return {"split": split, "crop": img_file, "kind": "bad_name",
+                "detail": "no idx separated by '_'"}, None
+
+    orig, idx = name.rsplit("_", 1)
+    if not idx.isdigit():
+        return {"split": split, "crop": img_file, "kind": "bad_name",
+                "detail": f"idx '{idx}' is not a number"}, None
+    idx = int(idx)
+
+    lines = label_index.get(orig)
+    if lines is None:
+        return {"split": split, "crop": img_file, "kind": "missing_label",
+                "detail": f"original label file NOT FOUND: {orig}.txt"}, None
+
+    if idx >= len(lines):
+        return {"split": split, "crop": img_file, "kind": "idx_out_of_range",
+                "detail": f"idx {idx} out of range (labels only {len(lines)})"}, None
+
+    actual_cls_id = lines[idx]
+    if actual_cls_id != expected_cls_id:
+        return {"split": split, "crop": img_file, "kind": "class_mismatch",
+                "detail": f"folder={folder} expects {expected_cls_id} but label line {idx} has {actual_cls_id}"}, None
+
+    return None, (orig, idx)
+
+
+def _phash_check(args):
+    """Re-derive every crop of one source image and compare perceptual hashes."""
+    import cv2
+    from convert_to_classify_severity import yolo_to_xyxy
+    from image_hash import hamming, phash_array, phash_file
+
+    split, source_image, label_file, crops, padding, output_size = args
+    errors = []
+    img = cv2.imread(source_image)
+    if img is None:
+        return [{"split": split, "crop": c, "kind": "unreadable_source", "detail": source_image} for c, _ in crops]
+    img_h, img_w = img.shape[:2]
+    lines = read_label_lines(label_file)
+
+    for crop_file, idx in crops:
+        # the label file may have changed since the crops were written
+        try:
+            parts = lines[idx].split()
+            if len(parts) != 5:
+                raise ValueError(f"{len(parts)} fields")
+            box = tuple(map(float, parts[1:5]))
+        except (IndexError, ValueError) as e:
+            errors.append({"split": split, "crop": crop_file, "kind": "malformed_label",
+                           "detail": f"{label_file} line {idx}: {e}"})
+            continue
+        x1, y1, x2, y2 = yolo_to_xyxy(box, img_w, img_h, padding)
+        derived = img[y1:y2, x1:x2]
+        stored = phash_file(crop_file)
+        if derived.size == 0 or stored is None:
+            errors.append({"split": split, "crop": crop_file, "kind": "unreadable_crop", "detail": ""})
+            continue
+        if output_size:
+            derived = cv2.resize(derived, tuple(output_size), interpolation=cv2.INTER_AREA)
+        dist = hamming(stored, phash_array(derived))
+        if dist > PHASH_MAX_DISTANCE:
+            errors.append({"split": split, "crop": crop_file, "kind": "phash_mismatch",
+                           "detail": f"{dist} bits from the crop re-derived from {source_image}"})
+    return errors
+
+
+def crop_settings(split_dir):
+    """Padding / output size the crops were written with (from the crop manifest)."""
+    manifest = split_dir / MANIFEST_NAME
+    if manifest.exists():
+        with open(manifest, "r") as f:
+            settings = json.load(f).get("settings", {})
+        return settings.get("padding", 0.0), settings.get("output_size")
+    return 0.0, None
+
+
+def verify_split(split, pool, use_phash):
+    errors, checked = [], 0
     class_split_folder = CLASS_DIR / split
+    if not class_split_folder.exists():
+        print(f"⚠️ Skipping {split} — missing {class_split_folder}")
+        return errors, checked
 
-    for cls_folder in class_split_folder.iterdir():
-        if not cls_folder.is_dir():
-            continue
+    label_index = build_label_index(YOLO_DIR / split / "labels", pool)
+    to_hash = defaultdict(list)   # orig stem -> [(crop, idx)]
 
-        expected_cls_id = REV_MAP.get(cls_folder.name)
-        if expected_cls_id is None:
+    for cls_folder in class_split_folder.iterdir():
+        if not cls_folder.is_dir() or cls_folder.name not in REV_MAP:
             continue  # skip unknown folders
-
         for img_file in cls_folder.glob("*.jpg"):
-            name = img_file.stem      # e.g. 000123_1
-            if "_" not in name:
-                errors.append(f"{img_file} has no idx separated by '_'")
+            checked += 1
+            error, ref = check_crop(split, str(img_file), cls_folder.name, label_index)
+            if error:
+                errors.append(error)
+            elif use_phash:
+                to_hash[ref[0]].append((str(img_file), ref[1]))
+
+    if use_phash and to_hash:
+        padding, output_size = crop_settings(class_split_folder)
+        sources = find_source_images(YOLO_DIR / split / "images")
+        jobs = []
+        for orig, crops in to_hash.items():
+            if orig not in sources:
+                errors += [{"split": split, "crop": c, "kind": "missing_source", "detail": orig} for c, _ in crops]
                 continue
-
-            orig, idx = name.split("_")
-            idx = int(idx)
-
-            label_file = YOLO_DIR / split / "labels" / f"{orig}.txt"
-            if not label_file.exists():
-                errors.append(f"{img_file}: original label file NOT FOUND: {label_file}")
-                continue
-
-            lines = open(label_file).read().strip().splitlines()
-
-            if idx >= len(lines):
-                errors.append(f"{img_file}: idx {idx} out of range (labels only {len(lines)})")
-                continue
-
-            actual_cls_id = lines[idx].split()[0]
-
-            if actual_cls_id != expected_cls_id:
-                errors.append(
-                    f"{img_file}: folder={cls_folder.name} expects {expected_cls_id} but label line {idx} has {actual_cls_id}"
-                )
-
-print("\n=== FINAL VERIFICATION RESULT ===")
-if not errors:
-    print("✅ ALL GOOD — classification dataset matches YOLO labels!")
-else:
-    print(f"❌ {len(errors)} mismatches found:")
-    for e in errors:
-        print(" -", e)
+            label_file = str(YOLO_DIR / split / "labels" / f"{orig}.txt")
+            jobs.append((split, sources[orig], label_file, crops, padding, output_size))
+        for errs in pool.map(_phash_check, jobs, chunksize=16):
+            errors += errs
+
+    return errors, checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify classification crops against the YOLO labels")
+    parser.add_argument("--phash", action="store_true",
+                        help="also re-derive each crop from its source image and compare perceptual hashes")
+    parser.add_argument("--output", default=str(REPORT_PATH), help="machine-readable JSON report")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    errors, checked = [], 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for split in splits:
+            split_errors, split_checked = verify_split(split, pool, args.phash)
+            errors += split_errors
+            checked += split_checked
+
+    kinds = Counter(e["kind"] for e in errors)
+    report = {"checked": checked, "errors": len(errors), "by_kind": dict(kinds), "phash": args.phash,
+              "details": errors}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n=== FINAL VERIFICATION RESULT ===")
+    if not errors:
+        print(f"✅ ALL GOOD — {checked} crops match YOLO labels!")
+    else:
+        print(f"❌ {len(errors)} mismatches found in {checked} crops:")
+        for kind, n in kinds.most_common():
+            print(f"  {kind}: {n}")
+        for e in errors[:20]:
+            print(" -", e["crop"], e["detail"])
+        if len(errors) > 20:
+            print(f" ... and {len(errors) - 20} more")
+    print(f"📄 report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()